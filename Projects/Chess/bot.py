@@ -0,0 +1,223 @@
+# Headless players for load tests.
+#
+# A Bot speaks the same TCP protocol as Network, but as a coroutine on an
+# asyncio loop instead of a thread, so one process runs thousands of them.
+# The bots of a process are ticked at TICK_RATE, spread over PHASES
+# equal parts of the tick so they do not all send at once: a bot holds
+# random keys for about TURN_EVERY seconds at a time (sometimes none), sends
+# an INPUT every tick while a key is held and acknowledges the snapshots it
+# gets, exactly like the game.
+#
+# Round trip time is measured from sending an INPUT to the first snapshot
+# showing the server applied it, so it includes the wait for the next
+# server tick, as a player would feel it. Round trips are counted in
+# RTT_UNIT wide bins, so the counts of many processes simply add up.
+#
+#   python bot.py --bots 100 --seconds 30
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import Counter, deque
+
+from protocol import Ack, Decoder, Delta, DeltaDecoder, Input, Redirect, Welcome, encode
+from simulation import DOWN, LEFT, RIGHT, TICK_RATE, UP
+
+KEYS = [RIGHT, LEFT, UP, DOWN, RIGHT | DOWN, LEFT | UP, 0]
+TURN_EVERY = 1.0            # seconds a bot keeps its keys, on average
+CONNECT_CONCURRENCY = 200   # connections opened at the same time
+PHASES = 6                  # groups of bots ticked one after the other within a tick
+RTT_UNIT = 0.0001           # seconds per round trip bin (0.1 ms)
+
+
+class BotStats:
+    """
+    Counters shared by the bots of one process; only updated while recording
+    """
+
+    def __init__(self):
+        self.recording = False
+        self.connected = self.failed = 0
+        self.sent = self.received = 0
+        self.rtts = Counter()  # round trip in RTT_UNITs -> inputs
+
+    def summary(self, seconds, cpu_seconds):
+        return {
+            "connected": self.connected,
+            "failed": self.failed,
+            "seconds": seconds,
+            "sent": self.sent,
+            "received": self.received,
+            "rtts": self.rtts,
+            "cpu_seconds": cpu_seconds,
+        }
+
+
+class Bot:
+
+    def __init__(self, stats, rng):
+        self.stats = stats
+        self.rng = rng
+        self.reader = self.writer = None
+        self.id = None
+        self.keys = rng.choice(KEYS)
+        self.sequence = 0
+        self.acked = 0
+        self.in_flight = deque()  # (sequence, send time) of inputs not applied yet
+        self.decoder = Decoder()
+        self.deltas = DeltaDecoder()
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        while self.id is None:
+            data = await self.reader.read(4096)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            for message in self.decoder.feed(data):
+                if isinstance(message, Welcome):
+                    self.id = message.player
+                elif isinstance(message, Redirect):
+                    # The player waiting for us is in another server process (supervisor.py)
+                    self.writer.close()
+                    self.decoder = Decoder()
+                    self.reader, self.writer = await asyncio.open_connection(host, message.port)
+                elif isinstance(message, Delta):
+                    self.deltas.apply(message)
+
+    def tick(self):
+        """
+        Send this tick's input (or only the acknowledgement when no key is held)
+        """
+        if self.rng.random() < 1 / (TURN_EVERY * TICK_RATE):
+            self.keys = self.rng.choice(KEYS)
+        ack = self.deltas.latest
+        if self.keys:
+            self.sequence += 1
+            self.writer.write(encode(Input(self.id, self.keys, self.sequence, ack)))
+            self.in_flight.append((self.sequence, time.perf_counter()))
+        elif ack != self.acked:
+            self.writer.write(encode(Ack(ack)))
+        else:
+            return
+        self.acked = ack
+        if self.stats.recording:
+            self.stats.sent += 1
+
+    async def listen(self):
+        while True:
+            data = await self.reader.read(4096)
+            if not data:
+                return
+            now = time.perf_counter()
+            for message in self.decoder.feed(data):
+                snapshot = self.deltas.apply(message) if isinstance(message, Delta) else None
+                if snapshot is None:
+                    continue
+                applied = snapshot.players[self.id].sequence
+                while self.in_flight and self.in_flight[0][0] <= applied:
+                    _, sent = self.in_flight.popleft()
+                    if self.stats.recording:
+                        self.stats.rtts[int((now - sent) / RTT_UNIT)] += 1
+                if self.stats.recording:
+                    self.stats.received += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_bots(host, port, count, start_at, end_at, seed=0):
+    """
+    Connect `count` bots, let them play, and record from start_at to end_at (time.time())
+    :return: BotStats.summary() of the recorded window
+    """
+    stats = BotStats()
+    bots = [Bot(stats, random.Random(seed * 1_000_003 + number)) for number in range(count)]
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(bot):
+        async with semaphore:
+            try:
+                await bot.connect(host, port)
+                stats.connected += 1
+            except OSError:
+                stats.failed += 1
+                bot.close()
+                bot.writer = None
+
+    await asyncio.gather(*(connect(bot) for bot in bots))
+    bots = [bot for bot in bots if bot.writer is not None]
+    listeners = [asyncio.ensure_future(bot.listen()) for bot in bots]
+
+    loop = asyncio.get_running_loop()
+    interval = 1 / (TICK_RATE * PHASES)
+    next_tick = loop.time()
+    phase = 0
+    cpu_start = None
+    cpu_seconds = 0.0
+    while time.time() < end_at:
+        if cpu_start is None and time.time() >= start_at:
+            stats.recording = True
+            cpu_start = time.process_time()
+        for bot in bots[phase::PHASES]:
+            if not bot.writer.is_closing():
+                bot.tick()
+        phase = (phase + 1) % PHASES
+        next_tick = max(next_tick + interval, loop.time())
+        await asyncio.sleep(next_tick - loop.time())
+    if cpu_start is not None:
+        cpu_seconds = time.process_time() - cpu_start
+    stats.recording = False
+
+    for bot in bots:
+        bot.close()
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    return stats.summary(end_at - start_at, cpu_seconds)
+
+
+def run_bots_process(host, port, count, start_at, end_at, seed=0):
+    """
+    Worker process entry point: run_bots on a new event loop
+    """
+    return asyncio.run(run_bots(host, port, count, start_at, end_at, seed))
+
+
+def percentile(rtts, percent):
+    """
+    Nearest-rank percentile of round trip counts
+    :return: seconds (None without any round trip)
+    """
+    total = sum(rtts.values())
+    if total == 0:
+        return None
+    rank = max(1, math.ceil(percent / 100 * total))
+    seen = 0
+    for rtt in sorted(rtts):
+        seen += rtts[rtt]
+        if seen >= rank:
+            return (rtt + 0.5) * RTT_UNIT
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless bots playing on the Chess server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--bots", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    now = time.time()
+    stats = run_bots_process(args.host, args.port, args.bots, now, now + args.seconds)
+    print(f"{stats['connected']} bots connected ({stats['failed']} failed), "
+          f"{stats['sent'] / args.seconds:.0f} messages/s sent, {stats['received'] / args.seconds:.0f} received")
+    rtts = stats["rtts"]
+    if rtts:
+        print("Round trip ms: " + "  ".join(f"p{p} {percentile(rtts, p) * 1000:.1f}" for p in (50, 95, 99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,37 @@
 import pygame
 from network import Network
+from simulation import DOWN, LEFT, RIGHT, SIZE, START, UP
+
+
+# Arrow keys and the simulation.py input bit they set
+KEYS = [(pygame.K_RIGHT, RIGHT), (pygame.K_LEFT, LEFT), (pygame.K_UP, UP), (pygame.K_DOWN, DOWN)]
 
 
 class Player():
-    width = height = 50
+    width = height = SIZE
 
     def __init__(self, startx, starty, color=(255,0,0)):
         self.x = startx
         self.y = starty
-        self.velocity = 2
         self.color = color
 
     def draw(self, g):
         pygame.draw.rect(g, self.color ,(self.x, self.y, self.width, self.height), 0)
 
-    def move(self, dirn):
-        """
-        :param dirn: 0 - 3 (right, left, up, down)
-        :return: None
-        """
-
-        if dirn == 0:
-            self.x += self.velocity
-        elif dirn == 1:
-            self.x -= self.velocity
-        elif dirn == 2:
-            self.y -= self.velocity
-        else:
-            self.y += self.velocity
-
 
 class Game:
 
-    def __init__(self, w, h):
-        self.net = Network()
+    def __init__(self, w, h, net=None):
+        self.net = net or Network()
         self.width = w
         self.height = h
-        self.player = Player(50, 50)
-        self.player2 = Player(100,100)
+        self.player = Player(*START[self.net.id])
+        self.player2 = Player(*START[1 - self.net.id])
         self.canvas = Canvas(self.width, self.height, "Testing...")
 
     def run(self):
         clock = pygame.time.Clock()
+        self.net.start()
         run = True
         while run:
             clock.tick(60)
@@ -53,26 +43,14 @@ class Game:
                 if event.type == pygame.K_ESCAPE:
                     run = False
 
-            keys = pygame.key.get_pressed()
-
-            if keys[pygame.K_RIGHT]:
-                if self.player.x <= self.width - self.player.velocity:
-                    self.player.move(0)
-
-            if keys[pygame.K_LEFT]:
-                if self.player.x >= self.player.velocity:
-                    self.player.move(1)
-
-            if keys[pygame.K_UP]:
-                if self.player.y >= self.player.velocity:
-                    self.player.move(2)
-
-            if keys[pygame.K_DOWN]:
-                if self.player.y <= self.height - self.player.velocity:
-                    self.player.move(3)
-
-            # Send Network Stuff
-            self.player2.x, self.player2.y = self.parse_data(self.send_data())
+            # Network Stuff (the network thread sends our keys to the server every tick,
+            # and the positions come from its snapshots; nothing here waits for the network)
+            pressed = pygame.key.get_pressed()
+            self.net.update(sum(bit for key, bit in KEYS if pressed[key]))
+            self.player.x, self.player.y = self.net.own_position()
+            peer = self.net.peer_position()
+            if peer is not None:
+                self.player2.x, self.player2.y = peer
 
             # Update Canvas
             self.canvas.draw_background()
@@ -80,25 +58,9 @@ class Game:
             self.player2.draw(self.canvas.get_canvas())
             self.canvas.update()
 
+        self.net.stop()
         pygame.quit()
 
-    def send_data(self):
-        """
-        Send position to server
-        :return: None
-        """
-        data = str(self.net.id) + ":" + str(self.player.x) + "," + str(self.player.y)
-        reply = self.net.send(data)
-        return reply
-
-    @staticmethod
-    def parse_data(data):
-        try:
-            d = data.split(":")[1].split(",")
-            return int(d[0]), int(d[1])
-        except:
-            return 0,0
-
 
 class Canvas:
 
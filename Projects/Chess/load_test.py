@@ -0,0 +1,223 @@
+# Load test of the Chess server: N bots (bot.py) against a local server,
+# for several N.
+#
+# For every number of clients a fresh server is started with --server-cmd,
+# so any server implementation that speaks the protocol can be measured the
+# same way. The bots are spread over --processes worker processes, play for
+# --warmup seconds (more with many clients, to let them all connect) and
+# are then measured for --seconds. Every row reports:
+#
+#   clients, connected          bots asked for and bots that got a seat
+#   rtt_p50/p95/p99_ms          INPUT sent -> snapshot showing it applied
+#   sent/received_per_second    messages from all bots / to all bots
+#   server_cpu_percent          of one core, over the measured seconds
+#   server_rss_mb, peak         resident memory of the server process
+#
+# The server's CPU and memory are added up over the process it was started
+# as and all its descendants, so a multi-process server such as
+# supervisor.py is measured by its workers. The peak is then the sum of
+# the peaks of every process.
+#   bots_cpu_percent            of the bot processes; near 100 per process
+#                               means the bots, not the server, were the limit
+#
+# Server CPU and memory come from /proc, so they are only measured on Linux.
+#
+#   python load_test.py --clients 2 10 100 1000 10000
+#   python load_test.py --clients 100 1000 --server-cmd "python server.py --no-udp --port {port}" \
+#       --label tcp-only --json tcp-only.json
+#   python load_test.py --clients 1000 --server-cmd "python supervisor.py --port {port}" --label workers
+
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bot import percentile, run_bots_process
+
+DEFAULT_CLIENTS = [2, 10, 100, 1000, 10000]
+DEFAULT_SERVER_CMD = f"{shlex.quote(sys.executable)} server.py --port {{port}}"
+COLUMNS = [
+    ("clients", "{}"), ("connected", "{}"),
+    ("rtt_p50_ms", "{:.1f}"), ("rtt_p95_ms", "{:.1f}"), ("rtt_p99_ms", "{:.1f}"),
+    ("sent_per_second", "{:.0f}"), ("received_per_second", "{:.0f}"),
+    ("server_cpu_percent", "{:.1f}"), ("server_rss_mb", "{:.1f}"), ("server_peak_rss_mb", "{:.1f}"),
+    ("bots_cpu_percent", "{:.1f}"),
+]
+
+
+def raise_open_files_limit():
+    """
+    Every bot and every server connection is a file descriptor; the server inherits the limit
+    :return: open files allowed per process, or None where it cannot be read (Windows)
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def process_usage(pid):
+    """
+    :return: (cpu seconds, rss MB, peak rss MB) of a process, or None where /proc is missing
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            # The fields after the ")" that ends the command name; utime and stime are 14 and 15
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as file:
+            status = dict(line.split(":", 1) for line in file if ":" in line)
+    except OSError:
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu, int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+
+
+def process_tree(pid):
+    """
+    :return: pid and the pids of all its descendants (only pid where /proc is missing)
+    """
+    pids = [pid]
+    for parent in pids:
+        try:
+            tasks = os.listdir(f"/proc/{parent}/task")
+        except OSError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{parent}/task/{task}/children") as file:
+                    pids += [int(child) for child in file.read().split()]
+            except OSError:
+                pass
+    return pids
+
+
+def tree_usage(pid):
+    """
+    :return: process_usage() added up over a process and its descendants, or None where /proc is missing
+    """
+    usages = [usage for usage in map(process_usage, process_tree(pid)) if usage is not None]
+    if not usages:
+        return None
+    return tuple(sum(values) for values in zip(*usages))
+
+
+def wait_for_server(host, port, process, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not open {host}:{port} within {timeout} seconds")
+
+
+def measure(clients, args):
+    """
+    Start a server, run `clients` bots against it and measure
+    :return: one result row (dict with the COLUMNS keys)
+    """
+    command = shlex.split(args.server_cmd.format(port=args.port))
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(args.host, args.port, server)
+        # The measurement window is the same wall clock time in every process
+        processes = max(1, min(args.processes, clients // 2))
+        start_at = time.time() + args.warmup + clients / 2000
+        end_at = start_at + args.seconds
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [
+                pool.submit(run_bots_process, args.host, args.port,
+                            clients // processes + (worker < clients % processes), start_at, end_at, worker)
+                for worker in range(processes)
+            ]
+            time.sleep(max(0.0, start_at - time.time()))
+            before = tree_usage(server.pid)
+            time.sleep(max(0.0, end_at - time.time()))
+            after = tree_usage(server.pid)
+            results = [future.result() for future in futures]
+    finally:
+        server.terminate()
+        server.wait()
+
+    rtts = Counter()
+    for result in results:
+        rtts.update(result["rtts"])
+    row = {
+        "clients": clients,
+        "connected": sum(result["connected"] for result in results),
+        "sent_per_second": sum(result["sent"] for result in results) / args.seconds,
+        "received_per_second": sum(result["received"] for result in results) / args.seconds,
+        "bots_cpu_percent": sum(result["cpu_seconds"] for result in results) / args.seconds * 100,
+    }
+    for percent in (50, 95, 99):
+        rtt = percentile(rtts, percent)
+        row[f"rtt_p{percent}_ms"] = rtt * 1000 if rtt is not None else None
+    if before is not None and after is not None:
+        row["server_cpu_percent"] = (after[0] - before[0]) / args.seconds * 100
+        row["server_rss_mb"], row["server_peak_rss_mb"] = after[1], after[2]
+    return row
+
+
+def print_row(row):
+    cells = []
+    for name, form in COLUMNS:
+        value = row.get(name)
+        cells.append(f"{form.format(value) if value is not None else '-':>{len(name)}}")
+    print("  ".join(cells), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the Chess server with many headless bots.")
+    parser.add_argument("--clients", type=int, nargs="+", default=DEFAULT_CLIENTS, help="numbers of bots to try")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--server-cmd", default=DEFAULT_SERVER_CMD,
+                        help="command starting the server under test, {port} is replaced")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="bot processes")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds before measuring")
+    parser.add_argument("--seconds", type=float, default=10, help="seconds measured per number of clients")
+    parser.add_argument("--label", default="", help="name of this server setup in the JSON report")
+    parser.add_argument("--json", metavar="REPORT.json", help="also write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    open_files = raise_open_files_limit()
+    if open_files is not None and max(args.clients) + 100 > open_files:
+        print(f"Warning: {open_files} open files allowed per process, not enough for {max(args.clients)} clients")
+
+    print("  ".join(name for name, _ in COLUMNS))
+    rows = []
+    for clients in args.clients:
+        rows.append(measure(clients, args))
+        print_row(rows[-1])
+
+    if args.json:
+        report = {
+            "label": args.label,
+            "server_cmd": args.server_cmd,
+            "cpus": os.cpu_count(),
+            "bot_processes": args.processes,
+            "seconds": args.seconds,
+            "results": rows,
+        }
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# A bad network on the local machine, for trying the UDP transport.
+#
+# A UDP proxy between the clients and the server that drops, delays and
+# duplicates packets in both directions. Random delays also reorder them.
+# Point the clients at the proxy's port:
+#
+#   python server.py
+#   python lossy_link.py --port 5556 --loss 0.2 --delay 0.05 --jitter 0.03
+#   Network(port=5556, transport="udp")
+
+import argparse
+import asyncio
+import random
+
+from server import HOST, PORT
+
+
+class Direction:
+    """
+    What happens to the packets going one way
+    """
+
+    def __init__(self, loss=0.0, delay=0.0, jitter=0.0, duplicate=0.0, rng=random):
+        self.loss = loss            # chance a packet is dropped
+        self.delay = delay          # seconds every packet takes
+        self.jitter = jitter        # up to this many seconds more, at random (reorders packets)
+        self.duplicate = duplicate  # chance a packet arrives twice
+        self.rng = rng
+        self.packets = self.dropped = 0
+
+    def forward(self, send, data):
+        self.packets += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        loop = asyncio.get_running_loop()
+        for _ in range(2 if self.rng.random() < self.duplicate else 1):
+            loop.call_later(self.delay + self.rng.uniform(0, self.jitter), send, data)
+
+
+class _Upstream(asyncio.DatagramProtocol):
+    """
+    The proxy's socket towards the server for one client
+    """
+
+    def __init__(self, link, client_addr):
+        self.link = link
+        self.client_addr = client_addr
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.link.down.forward(lambda packet: self.link.transport.sendto(packet, self.client_addr), data)
+
+
+class LossyLink(asyncio.DatagramProtocol):
+
+    def __init__(self, server_addr, up, down):
+        self.server_addr = server_addr
+        self.up = up        # Direction of client -> server packets
+        self.down = down    # Direction of server -> client packets
+        self.upstreams = {}  # client addr -> _Upstream
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        upstream = self.upstreams.get(addr)
+        if upstream is None:
+            upstream = self.upstreams[addr] = _Upstream(self, addr)
+            asyncio.ensure_future(self.connect(upstream))
+        self.up.forward(lambda packet: upstream.transport and upstream.transport.sendto(packet), data)
+
+    async def connect(self, upstream):
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: upstream, remote_addr=self.server_addr)
+
+    def report(self):
+        return (f"client -> server: {self.up.dropped} of {self.up.packets} packets dropped, "
+                f"server -> client: {self.down.dropped} of {self.down.packets} dropped")
+
+
+async def start_link(port, server_addr=(HOST, PORT), loss=0.0, delay=0.0, jitter=0.0, duplicate=0.0, seed=None):
+    """
+    Open the proxy on localhost:port (both directions get the same settings)
+    :return: LossyLink
+    """
+    rng = random.Random(seed)
+    up, down = (Direction(loss, delay, jitter, duplicate, rng) for _ in range(2))
+    link = LossyLink(server_addr, up, down)
+    await asyncio.get_running_loop().create_datagram_endpoint(lambda: link, local_addr=(HOST, port))
+    return link
+
+
+async def run(args):
+    link = await start_link(args.port, (args.server_host, args.server_port), args.loss, args.delay, args.jitter,
+                            args.duplicate, args.seed)
+    print(f"Lossy link on {HOST}:{args.port} -> {args.server_host}:{args.server_port}")
+    while True:
+        await asyncio.sleep(10)
+        print(link.report())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UDP proxy that loses, delays and duplicates packets.")
+    parser.add_argument("--port", type=int, default=PORT + 1, help="port the clients use")
+    parser.add_argument("--server-host", default=HOST)
+    parser.add_argument("--server-port", type=int, default=PORT)
+    parser.add_argument("--loss", type=float, default=0.1, help="chance a packet is dropped")
+    parser.add_argument("--delay", type=float, default=0.05, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="extra random delay in seconds")
+    parser.add_argument("--duplicate", type=float, default=0.01, help="chance a packet arrives twice")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable runs")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
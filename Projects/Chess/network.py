@@ -1,27 +1,269 @@
+import select
 import socket
+import threading
+import time
+from collections import deque
+
+from protocol import (Ack, Decoder, Delta, DeltaDecoder, Input, Join, Leave, ProtocolError, Redirect, Welcome,
+                      decode_packet, encode, encode_packet)
+from simulation import START, TICK_RATE, move
+
+INTERPOLATION_DELAY = 0.1   # the other player is drawn this many seconds in the past
+
+# UDP transport
+JOIN_RETRY = 0.25           # seconds between two JOIN packets until the WELCOME arrives
+JOIN_ATTEMPTS = 20
+KEEPALIVE = 2               # seconds; an idle client sends an ACK this often to keep its seat
+REDUNDANT_INPUTS = 3        # every packet repeats the newest inputs, so a lost packet loses none
+
+
+class SnapshotBuffer:
+    """
+    Recent positions of the other player with their arrival times, so it can
+    be drawn between updates instead of jumping from one to the next
+    """
+
+    def __init__(self, interval, size=32):
+        self.interval = interval             # seconds between two server ticks
+        self.snapshots = deque(maxlen=size)  # (arrival time, x, y)
+        self.lock = threading.Lock()
+
+    def add(self, arrival, x, y):
+        with self.lock:
+            # The server sends nothing while the player stands still, so after a
+            # pause it starts moving from where it stood one tick before
+            if self.snapshots and arrival - self.snapshots[-1][0] > 2 * self.interval:
+                self.snapshots.append((arrival - self.interval, *self.snapshots[-1][1:]))
+            self.snapshots.append((arrival, x, y))
+
+    def position(self, render_time):
+        """
+        :return: (x, y) at render_time, interpolated between the snapshots around it, or None before the first one
+        """
+        with self.lock:
+            snapshots = list(self.snapshots)
+        if not snapshots:
+            return None
+        if render_time <= snapshots[0][0]:
+            return snapshots[0][1:]
+        for (start, x0, y0), (end, x1, y1) in zip(reversed(snapshots[:-1]), reversed(snapshots)):
+            if start <= render_time:
+                if render_time >= end:
+                    break
+                t = (render_time - start) / (end - start)
+                return x0 + (x1 - x0) * t, y0 + (y1 - y0) * t
+        return snapshots[-1][1:]
 
 
 class Network:
 
-    def __init__(self):
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.host = "127.0.0.1"
-        self.port = 5555
+    def __init__(self, host="127.0.0.1", port=5555, tick_rate=TICK_RATE, transport="tcp"):
+        """
+        :param transport: "tcp", or "udp" where a lost packet never holds back the ones after it
+        """
+        self.udp = transport == "udp"
+        self.client = self.open_socket()
+        self.host = host
+        self.port = port
         self.addr = (self.host, self.port)
+        self.decoder = Decoder()
+        self.pending = deque()  # decoded messages not read yet
+        self.packets_sent = 0   # UDP packet sequence numbers
+        self.packet_received = 0
+        self.last_sent = time.perf_counter()
+        self.room = None
         self.id = self.connect()
 
+        # Background exchange, see start()
+        self.tick_rate = tick_rate
+        self.sequence = 0
+        self.keys = 0
+        self.position = START[self.id]      # our position, predicted from our inputs
+        self.unacked = deque(maxlen=256)    # (sequence, keys) of inputs the server has not applied yet
+        self.snapshots = SnapshotBuffer(1 / tick_rate)  # of the other player
+        self.deltas = DeltaDecoder()
+        self.acked = 0                      # last tick acknowledged to the server
+        self.running = False
+        self.thread = None
+
+    def open_socket(self):
+        if self.udp:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return client
+
     def connect(self):
-        self.client.connect(self.addr)
-        return self.client.recv(2048).decode()
+        """
+        :return: player id (0 or 1) given by the server
+        """
+        while True:
+            self.client.connect(self.addr)
+            welcome = self.receive() if not self.udp else self.join()
+            if isinstance(welcome, Welcome):
+                break
+            # A REDIRECT: the player waiting for us is in another server process (supervisor.py)
+            self.addr = (self.host, welcome.port)
+            if not self.udp:
+                self.client.close()
+                self.client = self.open_socket()
+            self.decoder = Decoder()
+            self.pending.clear()
+            self.packet_received = 0
+        self.room = welcome.room
+        return welcome.player
+
+    def join(self):
+        """
+        Repeat JOIN until the answer gets through (the server answers every one)
+        :return: Welcome or Redirect
+        """
+        self.client.settimeout(JOIN_RETRY)
+        try:
+            answer = None
+            for _ in range(JOIN_ATTEMPTS):
+                self.send_frames([encode(Join())])
+                try:
+                    while not isinstance(answer, (Welcome, Redirect)):
+                        answer = self.receive()
+                    return answer
+                except socket.timeout:
+                    pass
+            raise ConnectionError(f"No answer from {self.addr[0]}:{self.addr[1]} over UDP")
+        finally:
+            self.client.settimeout(None)
+
+    def receive(self):
+        """
+        Wait for the next complete message from the server
+        :return: Welcome, Redirect or Delta
+        """
+        while not self.pending:
+            self.pending.extend(self.read_messages())
+        return self.pending.popleft()
+
+    def read_messages(self):
+        """
+        One recv() from the server
+        :return: list of the messages completed by it (late UDP packets give none)
+        """
+        data = self.client.recv(65536)
+        if not self.udp:
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            return self.decoder.feed(data)
+        try:
+            sequence, messages = decode_packet(data)
+        except ProtocolError:
+            return []
+        if sequence <= self.packet_received:
+            return []
+        self.packet_received = sequence
+        return messages
+
+    def send_frames(self, frames):
+        if self.udp:
+            self.packets_sent += 1
+            self.client.send(encode_packet(self.packets_sent, frames))
+        else:
+            self.client.sendall(b"".join(frames))
+        self.last_sent = time.perf_counter()
+
+    def start(self):
+        """
+        Exchange inputs and snapshots in a background thread from now on,
+        at tick_rate inputs per second however fast the game draws
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, name="network", daemon=True)
+        self.thread.start()
+
+    def update(self, keys):
+        """
+        Set the keys held down (simulation.RIGHT | LEFT | UP | DOWN); the network thread sends them
+        every tick while any is held
+        """
+        self.keys = keys
+
+    def own_position(self):
+        """
+        :return: (x, y) of our player: the server's position plus the inputs it has not applied yet
+        """
+        return self.position
+
+    def peer_position(self):
+        """
+        :return: (x, y) of the other player INTERPOLATION_DELAY ago, or None before the first snapshot
+        """
+        return self.snapshots.position(time.perf_counter() - INTERPOLATION_DELAY)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        if self.udp:
+            try:
+                self.send_frames([encode(Leave())])
+            except socket.error:
+                pass
+        self.client.close()
+
+    def send_input(self):
+        """
+        One tick: send the keys held down, or only the acknowledgement of new snapshots when none is held
+        """
+        keys = self.keys
+        ack = self.deltas.latest
+        if keys:
+            self.sequence += 1
+            self.unacked.append((self.sequence, keys))
+            self.position = move(*self.position, keys)
+            inputs = list(self.unacked)[-REDUNDANT_INPUTS:] if self.udp else [self.unacked[-1]]
+            self.send_frames([encode(Input(self.id, held, sequence, ack)) for sequence, held in inputs])
+        elif ack != self.acked or (self.udp and time.perf_counter() - self.last_sent >= KEEPALIVE):
+            self.send_frames([encode(Ack(ack))])
+        self.acked = ack
+
+    def apply_delta(self, delta, arrival):
+        snapshot = self.deltas.apply(delta)
+        if snapshot is None:
+            return
+        peer = snapshot.players[1 - self.id]
+        self.snapshots.add(arrival, peer.x, peer.y)
+
+        # Reconcile: start from where the server has us and replay what it has not applied yet
+        me = snapshot.players[self.id]
+        while self.unacked and self.unacked[0][0] <= me.sequence:
+            self.unacked.popleft()
+        position = (me.x, me.y)
+        for _, keys in self.unacked:
+            position = move(*position, keys)
+        self.position = position
 
-    def send(self, data):
+    def loop(self):
         """
-        :param data: str
-        :return: str
+        Network thread: send our input every tick, and apply every snapshot
+        received in between (snapshots are never waited for, so latency
+        does not slow down the ticks)
         """
+        interval = 1 / self.tick_rate
+        next_tick = time.perf_counter()
         try:
-            self.client.send(str.encode(data))
-            reply = self.client.recv(2048).decode()
-            return reply
-        except socket.error as e:
-            return str(e)
+            while self.running:
+                now = time.perf_counter()
+                if now >= next_tick:
+                    self.send_input()
+                    next_tick = max(next_tick + interval, now)
+                ready, _, _ = select.select([self.client], [], [], max(0.0, next_tick - time.perf_counter()))
+                if ready or self.pending:
+                    # Messages that came together with the WELCOME are still pending
+                    messages = list(self.pending) + (self.read_messages() if ready else [])
+                    self.pending.clear()
+                    arrival = time.perf_counter()
+                    for message in messages:
+                        if isinstance(message, Delta):
+                            self.apply_delta(message, arrival)
+        except socket.error:
+            pass
+        finally:
+            self.running = False
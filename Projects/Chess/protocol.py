@@ -0,0 +1,269 @@
+# Binary wire protocol shared by the Chess client and server.
+#
+# TCP is a byte stream: one send() can arrive in several recv() calls and
+# several sends can arrive in one, so every message is framed with a 2 byte
+# length prefix. The payload starts with a message type byte:
+#
+#   WELCOME  player id, room id (struct "!BI")                server -> client on connect
+#   INPUT    player id, keys, sequence, last tick received    client -> server, every tick a key is held
+#   ACK      last tick received                               client -> server, when no INPUT carries it
+#   DELTA    tick, ticks since the baseline, changed fields   server -> client, when the room changed
+#   JOIN     (no fields)                                      client -> server, UDP only
+#   LEAVE    (no fields)                                      client -> server, UDP only
+#   REDIRECT port                                             server -> client instead of WELCOME: connect
+#                                                             again to that port (see supervisor.py)
+#
+# All integers after WELCOME are varints (7 bits per byte, small numbers
+# take one byte) and the changes in DELTA are zigzag-encoded, since they can
+# be negative.
+#
+# Snapshots are delta-encoded. The state of a room is a few integers: x, y
+# and the sequence of the last input applied, for each player. Positions are
+# whole pixels, as the simulation never moves by fractions. For every
+# client the server remembers the last snapshot that client acknowledged,
+# its baseline, and sends only the fields that differ from it, with a bit
+# mask telling which ones. A client whose room did not change gets nothing,
+# and a client without keys held sends nothing, so idle players cost no
+# bandwidth at all.
+#
+# Decoder collects the bytes of any number of recv() calls and returns the
+# messages that are complete, keeping the rest for the next call.
+#
+# Over UDP every datagram is one packet: a varint packet sequence number,
+# counted separately by each sender, followed by one or more frames as
+# above. Receivers drop packets that are not newer than the newest one
+# they have seen, so a late packet never moves a player back.
+
+import struct
+from collections import namedtuple
+
+from simulation import PLAYERS
+
+LENGTH = struct.Struct("!H")
+WELCOME, INPUT, ACK, DELTA, JOIN, LEAVE, REDIRECT = 1, 2, 3, 4, 5, 6, 7
+WELCOME_FORMAT = struct.Struct("!BBI")  # type, player id, room id
+FIELDS = 3 * PLAYERS                    # x, y, sequence of every player
+HISTORY = 64                            # ticks a baseline can be behind; older ones restart from zero
+RESEND_TICKS = 15                       # repeat an unacknowledged change after this many ticks
+
+Welcome = namedtuple("Welcome", "player room")
+Input = namedtuple("Input", "player keys sequence ack")
+Ack = namedtuple("Ack", "ack")
+Delta = namedtuple("Delta", "tick since mask changes")
+Join = namedtuple("Join", "")
+Leave = namedtuple("Leave", "")
+Redirect = namedtuple("Redirect", "port")
+Snapshot = namedtuple("Snapshot", "tick players")  # players: tuple of PlayerState
+PlayerState = namedtuple("PlayerState", "x y sequence")
+ZERO = (0,) * FIELDS  # the baseline of tick 0, known to everyone
+KINDS = {Input: INPUT, Ack: ACK, Join: JOIN, Leave: LEAVE, Redirect: REDIRECT}  # messages made of varints only
+MESSAGES = {kind: message for message, kind in KINDS.items()}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def write_varint(out, value):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    """
+    :return: (value, offset after it)
+    """
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ProtocolError("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def encode(message):
+    """
+    :param message: Welcome, Input, Ack, Delta, Join, Leave or Redirect
+    :return: bytes of one frame
+    """
+    if isinstance(message, Welcome):
+        payload = WELCOME_FORMAT.pack(WELCOME, *message)
+    else:
+        out = bytearray()
+        if isinstance(message, Delta):
+            out.append(DELTA)
+            integers = (message.tick, message.since, message.mask, *map(zigzag, message.changes))
+        else:
+            out.append(KINDS[type(message)])
+            integers = message
+        for value in integers:
+            write_varint(out, value)
+        payload = bytes(out)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode(payload):
+    """
+    :param payload: bytes of one frame without the length prefix
+    :return: Welcome, Input, Ack, Delta, Join, Leave or Redirect
+    """
+    kind = payload[0] if payload else None
+    if kind == WELCOME:
+        if len(payload) != WELCOME_FORMAT.size:
+            raise ProtocolError(f"WELCOME has {len(payload)} bytes instead of {WELCOME_FORMAT.size}")
+        return Welcome(*WELCOME_FORMAT.unpack(payload)[1:])
+    if kind != DELTA and kind not in MESSAGES:
+        raise ProtocolError(f"Unknown message type in {payload[:1]!r}")
+
+    integers = []
+    offset = 1
+    while offset < len(payload):
+        value, offset = read_varint(payload, offset)
+        integers.append(value)
+    try:
+        if kind != DELTA:
+            return MESSAGES[kind](*integers)
+        tick, since, mask, *changes = integers
+    except (TypeError, ValueError):
+        raise ProtocolError(f"Message type {kind} with {len(integers)} fields") from None
+    if len(changes) != bin(mask).count("1"):
+        raise ProtocolError(f"DELTA mask {mask:b} does not match its {len(changes)} changes")
+    return Delta(tick, since, mask, [unzigzag(change) for change in changes])
+
+
+def snapshot(tick, state):
+    """
+    Snapshot from a flat state tuple (x, y, sequence of every player)
+    """
+    return Snapshot(tick, tuple(PlayerState(*state[i:i + 3]) for i in range(0, FIELDS, 3)))
+
+
+class DeltaEncoder:
+    """
+    Server side, one per client: the snapshots sent to it and the baseline it acknowledged
+    """
+
+    def __init__(self):
+        self.base_tick, self.base = 0, ZERO
+        self.sent = {}  # tick -> state sent but not acknowledged yet
+        self.last_tick, self.last = 0, ZERO
+
+    def ack(self, tick):
+        if tick > self.base_tick and tick in self.sent:
+            self.base_tick, self.base = tick, self.sent[tick]
+            self.sent = {sent: state for sent, state in self.sent.items() if sent > tick}
+
+    def settled(self, state):
+        """
+        True when the client acknowledged `state`, so nothing needs to be sent until it changes
+        """
+        return self.last == state and self.last_tick == self.base_tick
+
+    def encode(self, tick, state):
+        """
+        :param state: flat tuple of FIELDS integers
+        :return: DELTA frame, or None when the client already has this state
+        """
+        if state == self.last:
+            waiting = self.last_tick != self.base_tick and tick - self.last_tick >= RESEND_TICKS
+            if not waiting:
+                return None
+        if tick - self.base_tick > HISTORY:
+            self.base_tick, self.base = 0, ZERO
+        mask = 0
+        changes = []
+        for field, (value, base) in enumerate(zip(state, self.base)):
+            if value != base:
+                mask |= 1 << field
+                changes.append(value - base)
+        self.sent = {sent: old for sent, old in self.sent.items() if sent >= tick - HISTORY}
+        self.sent[tick] = state
+        self.last_tick, self.last = tick, state
+        return encode(Delta(tick, tick - self.base_tick, mask, changes))
+
+
+class DeltaDecoder:
+    """
+    Client side: the states received lately, as baselines for the next deltas
+    """
+
+    def __init__(self):
+        self.states = {0: ZERO}  # tick -> state
+        self.latest = 0
+
+    def apply(self, delta):
+        """
+        :return: Snapshot, or None for a delta older than the latest one or with an unknown baseline
+        """
+        base = self.states.get(delta.tick - delta.since)
+        if delta.tick <= self.latest or base is None:
+            return None
+        state = list(base)
+        changes = iter(delta.changes)
+        for field in range(FIELDS):
+            if delta.mask >> field & 1:
+                state[field] += next(changes)
+        self.states[delta.tick] = tuple(state)
+        self.latest = delta.tick
+        for tick in [tick for tick in self.states if 0 < tick < delta.tick - HISTORY]:
+            del self.states[tick]
+        return snapshot(delta.tick, state)
+
+
+class Decoder:
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received bytes
+        :return: list of the messages completed by them (may be empty)
+        """
+        self.buffer += data
+        messages = []
+        start = 0
+        while len(self.buffer) - start >= LENGTH.size:
+            (size,) = LENGTH.unpack_from(self.buffer, start)
+            end = start + LENGTH.size + size
+            if len(self.buffer) < end:
+                break
+            messages.append(decode(bytes(self.buffer[start + LENGTH.size:end])))
+            start = end
+        del self.buffer[:start]
+        return messages
+
+
+def encode_packet(sequence, frames):
+    """
+    UDP datagram carrying the frames (from encode()) with a packet sequence number
+    """
+    out = bytearray()
+    write_varint(out, sequence)
+    return bytes(out) + b"".join(frames)
+
+
+def decode_packet(data):
+    """
+    :return: (packet sequence, list of messages)
+    """
+    sequence, offset = read_varint(data, 0)
+    decoder = Decoder()
+    messages = decoder.feed(data[offset:])
+    if decoder.buffer:
+        raise ProtocolError("Datagram ends inside a frame")
+    return sequence, messages
@@ -1,5 +1,14 @@
-import Projects.game as game
+import argparse
+
+import game
+from network import Network
 
 if __name__ == "__main__":
-    g = game.Game(500,500)
+    parser = argparse.ArgumentParser(description="Play against another player on the server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--udp", action="store_true", help="use UDP instead of TCP")
+    args = parser.parse_args()
+
+    g = game.Game(500,500, Network(args.host, args.port, transport="udp" if args.udp else "tcp"))
     g.run()
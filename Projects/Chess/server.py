@@ -1,58 +1,449 @@
-import socket
-from _thread import *
-import sys
+# Game server: many two-player rooms on one asyncio event loop.
+#
+# Every connection is a coroutine with a pair of asyncio streams instead of
+# a thread, so an idle player costs a few kilobytes of buffers rather than a
+# thread stack. Players are paired into rooms as they connect: a new player
+# takes the free seat of a waiting room, or opens a new room. Each room has
+# its own positions, so rooms never see each other's players.
+#
+# The server is authoritative and runs at a fixed tick (TICK_RATE per
+# second, see simulation.py). Connections only queue the INPUT messages of
+# their player; once per tick every room applies its queued inputs and sends
+# its snapshot to both players, delta-encoded against what each of them
+# acknowledged (nothing when the room did not change, see protocol.py).
+# Server CPU and bandwidth are therefore set by the tick rate and by how
+# much the players move, not by how fast the clients draw. Rooms where
+# nobody moves and every client is up to date are not even visited.
+#
+# Clients connect over TCP or, with the same messages, over UDP on the same
+# port number (see protocol.py and Network(transport="udp")). A UDP client
+# joins by repeating JOIN until it gets its WELCOME, and leaves with LEAVE
+# or by staying silent for PEER_TIMEOUT seconds.
+#
+# One server process uses one core; supervisor.py runs one per core on the
+# same port, see RoomTable.
+#
+#   python server.py
+#   python server.py --host 0.0.0.0 --port 5555 --tick-rate 30 --no-udp
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+import argparse
+import asyncio
+import time
+from collections import deque
 
-server = 'localhost'
-port = 5555
+from protocol import (Ack, Decoder, DeltaEncoder, Input, Join, Leave, ProtocolError, Redirect, Welcome,
+                      decode_packet, encode, encode_packet)
+from simulation import PLAYERS, START, TICK_RATE, move
 
-server_ip = socket.gethostbyname(server)
+HOST = 'localhost'
+PORT = 5555
+MAX_QUEUED_INPUTS = 4       # a player's older inputs are dropped beyond this
+MAX_INPUTS_PER_TICK = 2     # catch up after jitter, but never faster than twice the speed
+MAX_BUFFERED = 64 * 1024    # skip snapshots for clients that do not read them
+PEER_TIMEOUT = 10           # seconds of silence after which a UDP client has left
+CLAIM_TIMEOUT = 1           # seconds a redirected player has to arrive before its partner is offered again
 
-try:
-    s.bind((server, port))
 
-except socket.error as e:
-    print(str(e))
+class StreamPeer:
+    """
+    A client connected over TCP
+    """
 
-s.listen(2)
-print("Waiting for a connection")
+    def __init__(self, writer):
+        self.writer = writer
 
-currentId = "0"
-pos = ["0:50,50", "1:100,100"]
-def threaded_client(conn):
-    global currentId, pos
-    conn.send(str.encode(currentId))
-    currentId = "1"
-    reply = ''
-    while True:
-        try:
-            data = conn.recv(2048)
-            reply = data.decode('utf-8')
+    def send(self, frame):
+        if self.writer.transport.get_write_buffer_size() < MAX_BUFFERED:
+            self.writer.write(frame)
+
+
+class DatagramPeer:
+    """
+    A client sending to the UDP endpoint from `addr`
+    """
+
+    def __init__(self, transport, addr):
+        self.transport = transport
+        self.addr = addr
+        self.sequence = 0      # of the packets sent to it
+        self.received = 0      # newest packet sequence received from it
+        self.heard = time.monotonic()
+        self.room = None
+        self.player_id = None
+
+    def send(self, frame):
+        self.sequence += 1
+        self.transport.sendto(encode_packet(self.sequence, [frame]), self.addr)
+
+
+class Room:
+
+    def __init__(self, room_id):
+        self.id = room_id
+        self.players = [None] * PLAYERS  # StreamPeer or DatagramPeer of each seat, None when free
+        self.encoders = [None] * PLAYERS  # DeltaEncoder of each seat's client
+        self.pos = list(START)
+        self.inputs = [deque(maxlen=MAX_QUEUED_INPUTS) for _ in range(PLAYERS)]
+        self.applied = [0] * PLAYERS     # sequence of the last input applied per player
+        self.received = [0] * PLAYERS    # newest input sequence queued per player
+
+    def free_seat(self):
+        """
+        :return: player id of a free seat, or None when the room is full
+        """
+        for player_id, peer in enumerate(self.players):
+            if peer is None:
+                return player_id
+        return None
+
+    def empty(self):
+        return not any(self.players)
+
+    def settled(self, state):
+        """
+        True when there are no inputs to apply and every client has acknowledged `state`
+        """
+        return not any(self.inputs) and all(
+            encoder is None or encoder.settled(state) for encoder in self.encoders
+        )
+
+    def receive(self, player_id, message):
+        """
+        Queue an INPUT (each one once, as UDP clients repeat theirs) and take the acknowledgement of an INPUT or ACK
+        """
+        if isinstance(message, Input) and message.player == player_id:
+            if message.sequence > self.received[player_id]:
+                self.inputs[player_id].append(message)
+                self.received[player_id] = message.sequence
+        elif not isinstance(message, Ack):
+            raise ProtocolError(f"Unexpected message {message}")
+        self.encoders[player_id].ack(message.ack)
+
+    def step(self):
+        """
+        Apply the queued inputs of both players (one simulation tick)
+        """
+        for player_id, queue in enumerate(self.inputs):
+            for _ in range(min(len(queue), MAX_INPUTS_PER_TICK)):
+                message = queue.popleft()
+                self.pos[player_id] = move(*self.pos[player_id], message.keys)
+                self.applied[player_id] = message.sequence
+
+    def state(self):
+        """
+        Flat tuple of x, y and the last input applied of every player
+        """
+        return tuple(value for (x, y), applied in zip(self.pos, self.applied) for value in (x, y, applied))
+
+
+class RoomTable:
+    """
+    The players waiting for a partner in every worker process of supervisor.py.
+
+    All workers accept on the same port with SO_REUSEPORT, and the kernel
+    spreads new connections over them without knowing about rooms. The
+    number of waiting players of each worker is kept in shared memory; a
+    worker where nobody waits claims one of another worker's waiting players
+    and REDIRECTs the new player to that worker's private port, so both
+    players of a room are always in the same process.
+
+    A claim only reserves the waiting player until the redirected one
+    arrives, or for CLAIM_TIMEOUT seconds if it never does (its REDIRECT was
+    lost, it quit). Every worker publishes its waiting players each tick.
+    Finding a partner and counting the new player happen under one lock, so
+    two players connecting to different workers at once never both wait alone.
+    """
+
+    def __init__(self, waiting, claimed, claimed_at, lock, index, private_ports):
+        self.waiting = waiting              # multiprocessing.Array: waiting players per worker
+        self.claimed = claimed              # multiprocessing.Array: redirected players on their way, per worker
+        self.claimed_at = claimed_at        # multiprocessing.Array: time.monotonic() of the latest claim
+        self.lock = lock                    # multiprocessing.Lock guarding all three
+        self.index = index                  # this worker
+        self.private_ports = private_ports  # per worker, for redirected clients
+
+    def publish(self, waiting):
+        now = time.monotonic()
+        with self.lock:
+            self.waiting[self.index] = waiting
+            if self.claimed[self.index] and now - self.claimed_at[self.index] > CLAIM_TIMEOUT:
+                self.claimed[self.index] = 0  # they are not coming any more
+
+    def arrived(self):
+        """
+        A player redirected to this worker connected
+        """
+        with self.lock:
+            self.claimed[self.index] = max(0, self.claimed[self.index] - 1)
+
+    def reserved(self):
+        """
+        :return: waiting players of this worker claimed for redirected players still on their way
+        """
+        with self.lock:
+            return min(self.claimed[self.index], self.waiting[self.index])
+
+    def seat(self):
+        """
+        Find a new player a partner, here first
+        :return: private port of another worker where a player waits, or None to seat it here
+        """
+        with self.lock:
+            unclaimed = [waiting - claimed for waiting, claimed in zip(self.waiting, self.claimed)]
+            if unclaimed[self.index] > 0:
+                self.waiting[self.index] -= 1
+                return None
+            for worker, free in enumerate(unclaimed):
+                if free > 0:
+                    self.claimed[worker] += 1
+                    self.claimed_at[worker] = time.monotonic()
+                    return self.private_ports[worker]
+            self.waiting[self.index] += 1  # nobody waits anywhere: the new player waits here
+        return None
+
+
+class RoomRegistry:
+
+    def __init__(self, table=None):
+        self.rooms = {}    # room id -> Room
+        self.waiting = []  # rooms with a free seat, oldest first
+        self.active = set()  # rooms with inputs to apply or changes to send
+        self.table = table   # RoomTable when running as one of several workers
+        # Workers number their rooms index, index + workers, ... so room ids stay unique
+        self.next_id = table.index if table is not None else 0
+        self.id_step = len(table.private_ports) if table is not None else 1
+
+    def redirect_port(self):
+        """
+        :return: port of another worker where a new player finds a partner, or None to seat it here
+        """
+        if self.table is None:
+            return None
+        return self.table.seat()
+
+    def publish(self):
+        if self.table is not None:
+            self.table.publish(len(self.waiting))
+
+    def join(self, peer, redirected=False):
+        """
+        Seat a new player
+        :param redirected: it connected to the private port, sent here by another worker
+        :return: (room, player id)
+        """
+        # The oldest waiting players are kept for the redirected players on their way
+        skip = 0
+        if self.table is not None:
+            if redirected:
+                self.table.arrived()
+            else:
+                skip = self.table.reserved()
+        if len(self.waiting) > skip:
+            room = self.waiting[skip]
+        else:
+            room = Room(self.next_id)
+            self.next_id += self.id_step
+            self.rooms[room.id] = room
+            self.waiting.append(room)
+        player_id = room.free_seat()
+        room.players[player_id] = peer
+        room.encoders[player_id] = DeltaEncoder()
+        if room.free_seat() is None:
+            self.waiting.remove(room)
+        self.active.add(room)
+        self.publish()
+        return room, player_id
+
+    def leave(self, room, player_id):
+        room.players[player_id] = None
+        room.encoders[player_id] = None
+        room.pos[player_id] = START[player_id]
+        room.inputs[player_id].clear()
+        room.applied[player_id] = 0
+        room.received[player_id] = 0
+        if room.empty():
+            del self.rooms[room.id]
+            self.active.discard(room)
+            if room in self.waiting:
+                self.waiting.remove(room)
+        else:
+            self.active.add(room)
+            if room not in self.waiting:
+                self.waiting.append(room)
+        self.publish()
+
+
+async def handle_client(registry, reader, writer, redirect=False):
+    """
+    :param redirect: True on the port shared by all workers, where a new player may be sent elsewhere
+    """
+    if redirect:
+        port = registry.redirect_port()
+        if port is not None:
+            writer.write(encode(Redirect(port)))
+            writer.close()
+            return
+    room, player_id = registry.join(StreamPeer(writer), redirected=not redirect)
+    print(f"Connected to: {writer.get_extra_info('peername')} (room {room.id}, player {player_id})")
+    writer.write(encode(Welcome(player_id, room.id)))
+    decoder = Decoder()
+    try:
+        while True:
+            data = await reader.read(4096)
             if not data:
-                conn.send(str.encode("Goodbye"))
                 break
-            else:
-                print("Recieved: " + reply)
-                arr = reply.split(":")
-                id = int(arr[0])
-                pos[id] = reply
+            for message in decoder.feed(data):
+                room.receive(player_id, message)
+            registry.active.add(room)
+    except (ConnectionError, ProtocolError):
+        pass
+    finally:
+        registry.leave(room, player_id)
+        writer.close()
+        print(f"Connection Closed (room {room.id}, player {player_id}, {len(registry.rooms)} rooms open)")
+
+
+class DatagramServer(asyncio.DatagramProtocol):
+    """
+    The UDP endpoint: one DatagramPeer per client address
+    """
+
+    def __init__(self, registry, redirect=False):
+        self.registry = registry
+        self.redirect = redirect  # as in handle_client
+        self.peers = {}           # addr -> DatagramPeer
+        self.redirected = {}      # addr -> (port, time) of clients sent to another worker
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            sequence, messages = decode_packet(data)
+        except ProtocolError:
+            return
+        peer = self.peers.get(addr)
+        if peer is None:
+            if not any(isinstance(message, Join) for message in messages):
+                return
+            # Repeated JOINs get the same answer, so a seat is claimed only once
+            port = self.redirected[addr][0] if addr in self.redirected else None
+            if port is None and self.redirect:
+                port = self.registry.redirect_port()
+            if port is not None:
+                self.redirected[addr] = (port, time.monotonic())
+                self.transport.sendto(encode_packet(1, [encode(Redirect(port))]), addr)
+                return
+            peer = self.peers[addr] = DatagramPeer(self.transport, addr)
+            peer.room, peer.player_id = self.registry.join(peer, redirected=not self.redirect)
+            print(f"Connected to: {addr} over UDP (room {peer.room.id}, player {peer.player_id})")
+        elif sequence <= peer.received:
+            return  # late or duplicated packet
+        peer.received = sequence
+        peer.heard = time.monotonic()
+        try:
+            for message in messages:
+                if isinstance(message, Join):
+                    # Also answers the repeated JOINs of a client whose WELCOME was lost
+                    peer.send(encode(Welcome(peer.player_id, peer.room.id)))
+                elif isinstance(message, Leave):
+                    raise ProtocolError("Client left")
+                else:
+                    peer.room.receive(peer.player_id, message)
+        except ProtocolError:
+            self.drop(peer)
+            return
+        self.registry.active.add(peer.room)
+
+    def drop(self, peer):
+        del self.peers[peer.addr]
+        self.registry.leave(peer.room, peer.player_id)
+        print(f"Connection Closed (room {peer.room.id}, player {peer.player_id}, {len(self.registry.rooms)} rooms open)")
+
+    async def expire_peers(self):
+        """
+        Drop the UDP clients that were not heard from for PEER_TIMEOUT seconds
+        """
+        while True:
+            await asyncio.sleep(1)
+            silent_since = time.monotonic() - PEER_TIMEOUT
+            for peer in [peer for peer in self.peers.values() if peer.heard < silent_since]:
+                self.drop(peer)
+            self.redirected = {addr: sent for addr, sent in self.redirected.items() if sent[1] >= silent_since}
+
+
+async def run_ticks(registry, tick_rate=TICK_RATE):
+    """
+    The simulation loop: step every room and send its changes, tick_rate times per second
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1 / tick_rate
+    next_tick = loop.time()
+    tick = 0
+    while True:
+        tick += 1
+        for room in list(registry.active):
+            room.step()
+            state = room.state()
+            for peer, encoder in zip(room.players, room.encoders):
+                if peer is not None:
+                    frame = encoder.encode(tick, state)
+                    if frame is not None:
+                        peer.send(frame)
+            if room.settled(state):
+                registry.active.discard(room)
+        registry.publish()
+        # Fixed schedule; when a tick overruns, the next one starts right away
+        next_tick = max(next_tick + interval, loop.time())
+        await asyncio.sleep(next_tick - loop.time())
+
+
+async def listen(registry, host, port, udp, redirect=False, reuse_port=None):
+    """
+    Accept players on a TCP port and, with udp, on the UDP port of the same number
+    :return: list of coroutines to run
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(registry, reader, writer, redirect), host, port,
+        backlog=1024, reuse_port=reuse_port,
+    )
+    tasks = [server.serve_forever()]
+    if udp:
+        _, datagrams = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DatagramServer(registry, redirect), local_addr=(host, port), reuse_port=reuse_port
+        )
+        tasks.append(datagrams.expire_peers())
+    return tasks
 
-                if id == 0: nid = 1
-                if id == 1: nid = 0
 
-                reply = pos[nid][:]
-                print("Sending: " + reply)
+async def serve(host=HOST, port=PORT, tick_rate=TICK_RATE, udp=True, table=None):
+    """
+    :param table: RoomTable when this is one of the workers of supervisor.py; they all
+                  share `port` and each also accepts redirected players on its private port
+    """
+    registry = RoomRegistry(table)
+    if table is None:
+        tasks = await listen(registry, host, port, udp)
+    else:
+        tasks = await listen(registry, host, port, udp, redirect=True, reuse_port=True)
+        tasks += await listen(registry, host, table.private_ports[table.index], udp)
+    print(f"Waiting for connections on {host}:{port}{' (TCP and UDP)' if udp else ''}, {tick_rate} ticks per second")
+    await asyncio.gather(run_ticks(registry, tick_rate), *tasks)
 
-            conn.sendall(str.encode(reply))
-        except:
-            break
 
-    print("Connection Closed")
-    conn.close()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess game server with many two-player rooms.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="simulation ticks per second")
+    parser.add_argument("--no-udp", dest="udp", action="store_false", help="accept TCP clients only")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.tick_rate, args.udp))
+    except KeyboardInterrupt:
+        pass
 
-while True:
-    conn, addr = s.accept()
-    print("Connected to: ", addr)
 
-    start_new_thread(threaded_client, (conn,))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
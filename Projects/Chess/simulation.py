@@ -0,0 +1,31 @@
+# Movement rules of the game, shared by the server and the client.
+#
+# The server is authoritative: it moves the players by applying their inputs
+# once per tick. The client applies the same rules to its own inputs right
+# away (prediction), so its player does not wait a round trip to move, and
+# corrects itself whenever a server snapshot arrives.
+
+TICK_RATE = 30          # simulation ticks per second
+PLAYERS = 2             # per room
+WIDTH = HEIGHT = 500    # board size in pixels
+SIZE = 50               # players are SIZE x SIZE squares
+SPEED = 4               # pixels per tick (2 per frame at 60 FPS)
+START = [(50, 50), (100, 100)]
+
+# Input keys, as a bit mask
+RIGHT, LEFT, UP, DOWN = 1, 2, 4, 8
+
+
+def move(x, y, keys):
+    """
+    Position after one tick with `keys` held down, kept on the board
+    """
+    if keys & RIGHT:
+        x += SPEED
+    if keys & LEFT:
+        x -= SPEED
+    if keys & UP:
+        y -= SPEED
+    if keys & DOWN:
+        y += SPEED
+    return min(max(x, 0), WIDTH - SIZE), min(max(y, 0), HEIGHT - SIZE)
@@ -0,0 +1,124 @@
+# Run the Chess server on every core.
+#
+# One server process (server.py) uses one core. The supervisor starts one
+# worker process per core that all accept on the same port with
+# SO_REUSEPORT, so the kernel spreads new connections over them, and starts
+# a worker again when it dies. The two players of a room must be in the
+# same worker: the workers share the number of players waiting for a
+# partner in each of them (RoomTable), and a worker where nobody waits sends
+# a new player a REDIRECT to the private port of one where somebody does.
+# Worker i has the private port --port + PRIVATE_PORT_OFFSET + i.
+#
+# Stopping the supervisor (Ctrl-C or SIGTERM) stops the workers with it.
+# Every worker also watches the supervisor's sentinel and exits when it
+# dies, even when it is killed outright, with any multiprocessing start
+# method.
+#
+#   python supervisor.py
+#   python supervisor.py --workers 4 --port 5555 --no-udp --start-method spawn
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from server import HOST, PORT, RoomTable, serve
+from simulation import TICK_RATE
+
+PRIVATE_PORT_OFFSET = 100
+RESTART_DELAY = 1   # seconds before a worker that died is started again
+
+
+def exit_with_supervisor():
+    """
+    Exit this worker as soon as the supervisor that started it dies, however it died
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # not the supervisor's handler, if inherited
+    # The process that created the worker, not its OS parent (a forkserver with that start method)
+    supervisor = multiprocessing.parent_process()
+
+    def watch():
+        supervisor.join()
+        os._exit(0)
+
+    threading.Thread(target=watch, name="supervisor-watch", daemon=True).start()
+
+
+def run_worker(host, port, tick_rate, udp, shared, index, private_ports):
+    """
+    Worker process entry point: one server sharing `port` with the other workers
+    :param shared: (waiting, claimed, claimed_at, lock) of the RoomTable
+    """
+    exit_with_supervisor()
+    table = RoomTable(*shared, index, private_ports)
+    try:
+        asyncio.run(serve(host, port, tick_rate, udp, table))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(host=HOST, port=PORT, tick_rate=TICK_RATE, udp=True, workers=None, start_method=None):
+    """
+    :param start_method: multiprocessing start method of the workers (default: the platform's)
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("SO_REUSEPORT is not available here, run server.py instead")
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context(start_method)
+    waiting = context.Array("i", workers, lock=False)
+    claimed = context.Array("i", workers, lock=False)
+    claimed_at = context.Array("d", workers, lock=False)
+    lock = context.Lock()
+    private_ports = [port + PRIVATE_PORT_OFFSET + index for index in range(workers)]
+
+    def start(index):
+        # The players it had are gone with it
+        with lock:
+            waiting[index] = claimed[index] = 0
+        process = context.Process(
+            target=run_worker, name=f"worker-{index}", daemon=True,
+            args=(host, port, tick_rate, udp, (waiting, claimed, claimed_at, lock), index, private_ports),
+        )
+        process.start()
+        return process
+
+    # SIGTERM (e.g. from load_test.py) ends the loop below like Ctrl-C, so the workers are stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    processes = [start(index) for index in range(workers)]
+    print(f"{workers} workers on {host}:{port}, private ports {private_ports[0]}-{private_ports[-1]}")
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"Worker {index} exited with code {process.exitcode}, starting it again")
+                    processes[index] = start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one Chess server worker per core on the same port.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--no-udp", action="store_true", help="only accept TCP clients")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--start-method", choices=multiprocessing.get_all_start_methods(),
+                        help="how worker processes are started (default: the platform's)")
+    args = parser.parse_args(argv)
+    supervise(args.host, args.port, args.tick_rate, not args.no_udp, args.workers, args.start_method)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# The supervisor under every multiprocessing start method.
+#
+# For each start method available here, supervisor.py is started with two
+# workers; two clients must be seated in the same room, and once the
+# supervisor is stopped (SIGTERM) or killed (SIGKILL) its workers must exit
+# too, so the port is free again.
+#
+#   python -m unittest test_supervisor
+#   python -m pytest test_supervisor.py
+
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+from network import Network
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = "127.0.0.1"
+BASE_PORT = 7300
+START_TIMEOUT = 30
+EXIT_TIMEOUT = 10
+
+
+def port_open(port):
+    try:
+        socket.create_connection((HOST, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT") and hasattr(signal, "SIGKILL"), "needs SO_REUSEPORT")
+class SupervisorTest(unittest.TestCase):
+
+    def run_supervisor(self, start_method, stop_signal, port):
+        supervisor = subprocess.Popen(
+            [sys.executable, "supervisor.py", "--workers", "2", "--port", str(port), "--no-udp",
+             "--start-method", start_method],
+            cwd=HERE, stdout=subprocess.DEVNULL,
+        )
+        self.addCleanup(supervisor.kill)
+        self.assertTrue(wait_until(lambda: port_open(port), START_TIMEOUT), "no worker started")
+        time.sleep(0.5)  # let the probe connection leave its room
+
+        first = Network(HOST, port)
+        second = Network(HOST, port)
+        self.addCleanup(first.stop)
+        self.addCleanup(second.stop)
+        self.assertEqual(first.room, second.room)
+        self.assertEqual({first.id, second.id}, {0, 1})
+
+        supervisor.send_signal(stop_signal)
+        supervisor.wait(EXIT_TIMEOUT)
+        self.assertTrue(wait_until(lambda: not port_open(port), EXIT_TIMEOUT), "workers outlived the supervisor")
+
+    def test_start_methods(self):
+        methods = multiprocessing.get_all_start_methods()
+        for number, method in enumerate(methods):
+            for offset, stop_signal in enumerate((signal.SIGTERM, signal.SIGKILL)):
+                with self.subTest(start_method=method, signal=stop_signal.name):
+                    self.run_supervisor(method, stop_signal, BASE_PORT + 10 * number + offset * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,11 @@
 # Date: 
 # Student ID: 
 
+from traffic_metrics import Metric, compile_metrics, metrics_fingerprint
+from traffic_parallel import load_cube
+from traffic_profile import PROFILER
+
+
 # Task A: Input Validation
 def validate_date_input():
     while True:
@@ -19,11 +24,15 @@ def validate_date_input():
             if not (2000 <= year <= 2024):
                 raise ValueError("Year must be between 2000 and 2024.")
             
-            return f"traffic_data{day:02}{month:02}{year}.csv"
+            return data_file_name(day, month, year)
         except ValueError as e:
             print(f"Invalid input: {e}")
 
 
+def data_file_name(day, month, year):
+    return f"traffic_data{day:02}{month:02}{year}.csv"
+
+
 def validate_continue_input():
     while True:
         choice = input("\nDo you want to load another dataset? (Y/N): ").strip().upper()
@@ -34,99 +43,111 @@ def validate_continue_input():
 
 
 # Task B: Processed Outcomes
-def process_csv_data(file_path):
-    try:
-        # Open the file and read lines
-        with open(file_path, "r") as file:
-            rows = []
-            headers = file.readline().strip().split(",")
-
-            # Read rows and split them into dictionaries
-            for line in file:
-                row_values = line.strip().split(",")
-                rows.append(dict(zip(headers, row_values)))
-    except FileNotFoundError:
-        print(f"File {file_path} does not exist.")
-        return None
 
-    required_columns = [
-        "JunctionName", "Date", "timeOfDay", "travel_Direction_in", "travel_Direction_out",
-        "Weather_Conditions", "JunctionSpeedLimit", "VehicleSpeed", "VehicleType", "elctricHybrid"
-    ]
-    
-    if not all(col in headers for col in required_columns):
-        print("CSV file does not have the required format.")
-        return None
+# Junctions drawn first in the hourly histogram (and always present in it)
+HISTOGRAM_JUNCTIONS = ["Elm Avenue/Rabbit Road", "Hanley Highway/Westway"]
 
-    # Data Processing Logic
-    total_vehicles = len(rows)
-    total_trucks = sum(1 for row in rows if row["VehicleType"] == "Truck")
-    total_electric_vehicles = sum(1 for row in rows if row["elctricHybrid"].lower() == "true")
-    two_wheeled = sum(1 for row in rows if row["VehicleType"] in ["Bike", "Motorbike", "Scooter"])
-    buses_north = sum(
-        1 for row in rows
-        if row["JunctionName"] == "Elm Avenue/Rabbit Road" and 
-           row["VehicleType"] == "Buss" and 
-           row["travel_Direction_out"] == "N"
-    )
-    no_turn_vehicles = sum(1 for row in rows if row["travel_Direction_in"] == row["travel_Direction_out"])
-    truck_percentage = round((total_trucks / total_vehicles) * 100)
-    
-    bicycles_per_hour = {}
-    for row in rows:
-        if row["VehicleType"] == "Bicycle":
-            hour = int(row["timeOfDay"].split(":")[0])
-            bicycles_per_hour[hour] = bicycles_per_hour.get(hour, 0) + 1
-    average_bicycles_per_hour = round(sum(bicycles_per_hour.values()) / len(bicycles_per_hour)) if bicycles_per_hour else 0
-    
-    over_speed_vehicles = sum(
-        1 for row in rows 
-        if int(row["VehicleSpeed"]) > int(row["JunctionSpeedLimit"])
-    )
-    elm_avenue_vehicles = sum(1 for row in rows if row["JunctionName"] == "Elm Avenue/Rabbit Road")
-    hanley_highway_vehicles = sum(1 for row in rows if row["JunctionName"] == "Hanley Highway/Westway")
-    scooters_elm_avenue = sum(
-        1 for row in rows 
-        if row["JunctionName"] == "Elm Avenue/Rabbit Road" and row["VehicleType"] == "Scooter"
-    )
-    scooter_percentage = round((scooters_elm_avenue / elm_avenue_vehicles) * 100) if elm_avenue_vehicles else 0
-
-    hanley_traffic = {}
-    for row in rows:
-        if row["JunctionName"] == "Hanley Highway/Westway":
-            hour = int(row["timeOfDay"].split(":")[0])
-            hanley_traffic[hour] = hanley_traffic.get(hour, 0) + 1
-    max_traffic = max(hanley_traffic.values(), default=0)
-    busiest_hours = [
-        f"Between {hour}:00 and {hour + 1}:00" 
-        for hour, count in hanley_traffic.items() if count == max_traffic
-    ]
-
-    rainy_hours = set(
-        int(row["timeOfDay"].split(":")[0]) 
-        for row in rows if row["Weather_Conditions"] == "Rain"
-    )
-
-    # Store Results
-    outcomes = {
-        "Total vehicles": total_vehicles,
-        "Total trucks": total_trucks,
-        "Total electric vehicles": total_electric_vehicles,
-        "Two-wheeled vehicles": two_wheeled,
-        "Buses heading north (Elm Avenue/Rabbit Road)": buses_north,
-        "Vehicles going straight": no_turn_vehicles,
-        "Percentage of trucks": truck_percentage,
-        "Average bicycles per hour": average_bicycles_per_hour,
-        "Vehicles over speed limit": over_speed_vehicles,
-        "Vehicles at Elm Avenue/Rabbit Road": elm_avenue_vehicles,
-        "Vehicles at Hanley Highway/Westway": hanley_highway_vehicles,
-        "Percentage of scooters at Elm Avenue/Rabbit Road": scooter_percentage,
-        "Peak hour traffic at Hanley Highway/Westway": max_traffic,
-        "Peak hour(s) at Hanley Highway/Westway": busiest_hours,
-        "Total hours of rain": len(rainy_hours),
+
+def process_csv_data(file_path, workers=1):
+    # Large files are split into chunks and parsed by `workers` processes
+    # (None = one per core); see traffic_parallel.py
+    cube = load_cube(file_path, workers)
+    if cube is None:
+        return None
+    return compute_outcomes(cube)
+
+
+# Every outcome is declared as a metric spec; all of them are evaluated on
+# the count cube, which is filled in a single pass over the file. To add an
+# outcome, add a Metric here.
+OUTCOME_METRICS = [
+    Metric("Total vehicles"),
+    Metric("Total trucks", where={"vehicle_type": "Truck"}),
+    Metric("Total electric vehicles", measure="electric"),
+    Metric("Two-wheeled vehicles", where={"vehicle_type": ["Bike", "Motorbike", "Scooter"]}),
+    Metric(
+        "Buses heading north (Elm Avenue/Rabbit Road)",
+        measure="heading_north",
+        where={"junction": "Elm Avenue/Rabbit Road", "vehicle_type": "Buss"},
+    ),
+    Metric("Vehicles going straight", measure="straight"),
+    Metric("Percentage of trucks", "ratio", where={"vehicle_type": "Truck"}),
+    Metric("Average bicycles per hour", "mean", where={"vehicle_type": "Bicycle"}, group_by="hour"),
+    Metric("Vehicles over speed limit", measure="over_limit"),
+    Metric("Vehicles at Elm Avenue/Rabbit Road", where={"junction": "Elm Avenue/Rabbit Road"}),
+    Metric("Vehicles at Hanley Highway/Westway", where={"junction": "Hanley Highway/Westway"}),
+    Metric(
+        "Percentage of scooters at Elm Avenue/Rabbit Road",
+        "ratio",
+        where={"junction": "Elm Avenue/Rabbit Road", "vehicle_type": "Scooter"},
+        of={"junction": "Elm Avenue/Rabbit Road"},
+    ),
+    Metric(
+        "Peak hour traffic at Hanley Highway/Westway",
+        "max",
+        where={"junction": "Hanley Highway/Westway"},
+        group_by="hour",
+    ),
+    Metric(
+        "Peak hour(s) at Hanley Highway/Westway",
+        "argmax",
+        where={"junction": "Hanley Highway/Westway"},
+        group_by="hour",
+        label=lambda hour: f"Between {hour}:00 and {hour + 1}:00",
+    ),
+    Metric("Total hours of rain", "groups", where={"weather": "Rain"}, group_by="hour"),
+]
+
+# cube -> outcomes dict
+compute_outcomes = compile_metrics(OUTCOME_METRICS)
+
+# Outcomes reported for every junction in the file. Each metric is evaluated
+# for all junctions at once from one group-by of the cube, so the cost does
+# not grow with the number of junctions times the number of metrics.
+JUNCTION_METRICS = [
+    Metric("Vehicles", per="junction"),
+    Metric("Percentage of trucks", "ratio", where={"vehicle_type": "Truck"}, per="junction"),
+    Metric("Percentage of scooters", "ratio", where={"vehicle_type": "Scooter"}, per="junction"),
+    Metric("Electric vehicles", measure="electric", per="junction"),
+    Metric("Vehicles over speed limit", measure="over_limit", per="junction"),
+    Metric("Peak hour traffic", "max", group_by="hour", per="junction"),
+    Metric(
+        "Peak hour(s)",
+        "argmax",
+        group_by="hour",
+        per="junction",
+        label=lambda hour: f"Between {hour}:00 and {hour + 1}:00",
+    ),
+]
+
+compute_junction_metrics = compile_metrics(JUNCTION_METRICS)
+
+# Changes whenever a metric above changes, so results cached by an older
+# version are recomputed (see traffic_cache.py)
+METRICS_VERSION = metrics_fingerprint(OUTCOME_METRICS, JUNCTION_METRICS)
+
+
+def junction_outcomes(cube):
+    """
+    :return: dict of junction -> {outcome name: value}, for every junction in the file
+    """
+    by_metric = compute_junction_metrics(cube)
+    return {
+        junction: {name: values[junction] for name, values in by_metric.items()}
+        for junction in cube.junctions
     }
 
-    return outcomes
+
+@PROFILER.timed("histograms")
+def hourly_histograms(cube):
+    """
+    :return: dict of junction -> list of 24 vehicle counts, one per hour, for
+        HISTOGRAM_JUNCTIONS followed by every other junction of the file by name
+    """
+    (junctions, _), counts = cube.grouped(("junction", "hour"))
+    hourly = dict(zip(junctions, counts.tolist()))
+    order = HISTOGRAM_JUNCTIONS + sorted(junction for junction in junctions if junction not in HISTOGRAM_JUNCTIONS)
+    return {junction: hourly.get(junction, [0] * 24) for junction in order}
 
 
 def display_outcomes(outcomes):
@@ -136,7 +157,15 @@ def display_outcomes(outcomes):
             print(f"{key}: {value}")
 
 
+def display_junction_outcomes(junctions):
+    if junctions:
+        print("\nOutcomes per junction:")
+        for junction, outcomes in junctions.items():
+            print(f"{junction}: " + ", ".join(f"{key} {value}" for key, value in outcomes.items()))
+
+
 # Task C: Save Results to Text File
+@PROFILER.timed("save")
 def save_results_to_file(outcomes, file_name="results.txt"):
     if outcomes:
         with open(file_name, "a") as file:
@@ -151,9 +180,13 @@ def main():
     date = validate_date_input()
     file_path = date
     
-    outcomes = process_csv_data(file_path)
+    # Imported here because traffic_cache itself builds on this module
+    from traffic_cache import ResultCache
+    cache = ResultCache()
+    outcomes, _ = cache.process(file_path, workers=None)
     if outcomes:
         display_outcomes(outcomes)
+        display_junction_outcomes(cache.junctions(file_path))
         save_results_to_file(outcomes)
     
 
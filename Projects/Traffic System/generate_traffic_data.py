@@ -0,0 +1,121 @@
+# Seeded generator of synthetic traffic_dataDDMMYYYY.csv files.
+#
+# The rows follow the shape of the real junction files: the same columns and
+# junctions, morning and evening rush hours, weather that holds for an hour
+# at a time, and speeds scattered around each junction's limit. The same
+# seed, date and row count always give the same file.
+#
+#   python generate_traffic_data.py --date 01/01/2024 --rows 1000000 --seed 7
+#   python generate_traffic_data.py --rows 1000000 --junctions 400   # a whole city network
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+
+from Traffic import data_file_name
+from traffic_columns import REQUIRED_COLUMNS
+
+JUNCTIONS = {
+    # name: (speed limit, share of the traffic)
+    "Elm Avenue/Rabbit Road": (30, 0.48),
+    "Hanley Highway/Westway": (20, 0.52),
+}
+VEHICLE_TYPES = {
+    "Car": 0.26, "Van": 0.16, "Bicycle": 0.17, "Motorcycle": 0.11,
+    "Truck": 0.10, "Buss": 0.10, "Scooter": 0.10,
+}
+WEATHER = {"Clear": 0.32, "Overcast": 0.27, "Light Rain": 0.23, "Bright": 0.12, "Rain": 0.06}
+DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+ELECTRIC_SHARE = 0.33
+STRAIGHT_SHARE = 0.36
+
+# Relative traffic per hour, with peaks around 08:00 and 18:00
+HOUR_WEIGHTS = np.array([
+    2, 1.5, 1.2, 1, 1, 1.5, 3, 6, 9, 7, 5, 4,
+    4, 4, 4.5, 5, 6.5, 8.5, 9, 6, 4.5, 3.5, 3, 2.5,
+])
+
+CHUNK_ROWS = 200_000
+
+
+def choose(rng, options, size):
+    names = list(options)
+    weights = np.array(list(options.values()), dtype=float)
+    return rng.choice(len(names), size=size, p=weights / weights.sum()), names
+
+
+def city_junctions(count, rng):
+    """
+    The two real junctions plus count - 2 numbered ones with random limits and traffic
+    """
+    junctions = dict(JUNCTIONS)
+    for number in range(1, count - len(JUNCTIONS) + 1):
+        junctions[f"Junction {number:03}"] = (int(rng.choice([20, 30, 40, 50])), float(rng.uniform(0.2, 1.0)))
+    return junctions
+
+
+def generate(file_path, rows, date, seed=0, junctions=len(JUNCTIONS)):
+    """
+    Write `rows` synthetic rows for `date` (a datetime) to file_path
+    :param junctions: number of junctions in the file (at least the two real ones)
+    """
+    rng = np.random.default_rng(seed)
+    date_text = date.strftime("%d/%m/%Y")
+    # One weather per hour for the whole day
+    weather_codes, weather_names = choose(rng, WEATHER, 24)
+    network = city_junctions(junctions, rng) if junctions > len(JUNCTIONS) else JUNCTIONS
+    junction_names = list(network)
+    limits = np.array([limit for limit, _ in network.values()])
+    hour_p = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+    with open(file_path, "w") as file:
+        file.write(",".join(REQUIRED_COLUMNS) + "\n")
+        written = 0
+        while written < rows:
+            size = min(CHUNK_ROWS, rows - written)
+            junction, _ = choose(rng, {name: share for name, (_, share) in network.items()}, size)
+            vehicle, vehicle_names = choose(rng, VEHICLE_TYPES, size)
+            hour = rng.choice(24, size=size, p=hour_p)
+            minute = rng.integers(0, 60, size)
+            second = rng.integers(0, 60, size)
+            direction_in = rng.integers(0, len(DIRECTIONS), size)
+            turn = rng.integers(1, len(DIRECTIONS), size)
+            direction_out = np.where(rng.random(size) < STRAIGHT_SHARE, direction_in, (direction_in + turn) % len(DIRECTIONS))
+            limit = limits[junction]
+            speed = np.clip(np.rint(rng.normal(limit - 2, 6, size)), 1, None).astype(int)
+            electric = rng.random(size) < ELECTRIC_SHARE
+
+            lines = [
+                f"{junction_names[j]},{date_text},{h:02}:{m:02}:{s:02},{DIRECTIONS[d_in]},{DIRECTIONS[d_out]},"
+                f"{weather_names[weather_codes[h]]},{lim},{spd},{vehicle_names[v]},{'True' if e else 'False'}\n"
+                for j, h, m, s, d_in, d_out, lim, spd, v, e in zip(
+                    junction.tolist(), hour.tolist(), minute.tolist(), second.tolist(),
+                    direction_in.tolist(), direction_out.tolist(), limit.tolist(), speed.tolist(),
+                    vehicle.tolist(), electric.tolist(),
+                )
+            ]
+            file.writelines(lines)
+            written += size
+    return file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic traffic data file.")
+    parser.add_argument("--date", default="01/01/2024", help="day of the data, DD/MM/YYYY")
+    parser.add_argument("--rows", type=int, default=10_000, help="number of vehicles")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--junctions", type=int, default=len(JUNCTIONS), help="number of junctions")
+    parser.add_argument("--output-dir", default=".", help="folder to write the CSV to")
+    args = parser.parse_args(argv)
+
+    date = datetime.strptime(args.date, "%d/%m/%Y")
+    os.makedirs(args.output_dir, exist_ok=True)
+    file_path = os.path.join(args.output_dir, data_file_name(date.day, date.month, date.year))
+    generate(file_path, args.rows, date, args.seed, args.junctions)
+    print(f"Wrote {args.rows} rows to {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Round trip of the sample days through .tcol files.
+#
+# expected_outcomes.json holds the outcomes of every traffic_data*.csv in
+# this folder as computed by the original row-by-row process_csv_data().
+# Each day is converted to a .tcol file (in a temporary folder), loaded
+# again through the memory-mapped path and must give the same outcomes.
+#
+#   python -m unittest test_traffic_columns
+#   python -m pytest test_traffic_columns.py
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from Traffic import process_csv_data
+from traffic_columns import binary_path_for, convert, open_binary
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXPECTED = os.path.join(HERE, "expected_outcomes.json")
+
+
+class BinaryRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(EXPECTED) as file:
+            self.expected = json.load(file)
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_sample_days_match_original_outcomes(self):
+        self.assertTrue(self.expected)
+        for name, outcomes in self.expected.items():
+            with self.subTest(day=name):
+                file_path = shutil.copy(os.path.join(HERE, name), self.folder)
+                self.assertEqual(convert(file_path), binary_path_for(file_path))
+                self.assertIsNotNone(open_binary(binary_path_for(file_path), file_path))
+                self.assertEqual(process_csv_data(file_path), outcomes)
+
+    def test_rejected_rows_stay_out_of_the_header(self):
+        name = next(iter(self.expected))
+        with open(os.path.join(HERE, name)) as source:
+            lines = source.readlines()
+        file_path = os.path.join(self.folder, name)
+        with open(file_path, "w") as file:
+            file.writelines(lines + ["not,a,row\n"] * 1000)
+
+        binary_path = convert(file_path)
+        columns = open_binary(binary_path, file_path)
+        self.assertEqual(columns.rejected_count, 1000)
+        self.assertEqual(columns.rejected, [])
+        self.assertLess(os.path.getsize(binary_path), 64 * 1024)
+        self.assertEqual(process_csv_data(file_path), self.expected[name])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# Non-interactive batch mode for the traffic analyzer.
+#
+# Processes many traffic_dataDDMMYYYY.csv files in one run, spread over a
+# pool of worker processes, and writes one JSON file of outcomes per day
+# plus a merged summary.
+#
+# Examples:
+#   python traffic_batch.py --start 01/01/2024 --end 31/12/2024
+#   python traffic_batch.py --glob "traffic_data*2024.csv" --workers 8
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from Traffic import data_file_name, display_outcomes, process_csv_data
+from traffic_cache import DEFAULT_CACHE_DIR, cached_outcomes
+from traffic_profile import PROFILER, add_profile_argument, profiled_map, start_profiling
+
+# Outcomes that are plain counts and can be added up across days
+SUMMED_OUTCOMES = [
+    "Total vehicles",
+    "Total trucks",
+    "Total electric vehicles",
+    "Two-wheeled vehicles",
+    "Buses heading north (Elm Avenue/Rabbit Road)",
+    "Vehicles going straight",
+    "Vehicles over speed limit",
+    "Vehicles at Elm Avenue/Rabbit Road",
+    "Vehicles at Hanley Highway/Westway",
+    "Total hours of rain",
+]
+
+
+def files_for_date_range(start, end, data_dir="."):
+    """
+    :param start: first date, "DD/MM/YYYY"
+    :param end: last date (inclusive), "DD/MM/YYYY"
+    :return: list of file paths, one per day
+    """
+    day = datetime.strptime(start, "%d/%m/%Y")
+    last = datetime.strptime(end, "%d/%m/%Y")
+    paths = []
+    while day <= last:
+        paths.append(os.path.join(data_dir, data_file_name(day.day, day.month, day.year)))
+        day += timedelta(days=1)
+    return paths
+
+
+def file_date(file_path):
+    """
+    "traffic_data15062024.csv" -> "15/06/2024"
+    """
+    digits = os.path.basename(file_path)[len("traffic_data"):][:8]
+    return f"{digits[0:2]}/{digits[2:4]}/{digits[4:8]}"
+
+
+def date_order(file_path):
+    """
+    Sort key that puts files in calendar order (DDMMYYYY does not sort by name)
+    """
+    try:
+        return datetime.strptime(file_date(file_path), "%d/%m/%Y"), file_path
+    except ValueError:
+        return datetime.max, file_path
+
+
+def process_files(paths, workers=None, cache_dir=None):
+    """
+    Process every file in a pool of worker processes.
+    :param cache_dir: result cache folder, or None to always parse the files
+    :return: dict of file path -> outcomes, in the order of paths (missing files left out)
+    """
+    worker = partial(cached_outcomes, cache_dir=cache_dir) if cache_dir else process_csv_data
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = profiled_map(pool, worker, paths)
+        return {path: outcomes for path, outcomes in zip(paths, results) if outcomes}
+
+
+def merge_outcomes(daily):
+    """
+    Combine the outcomes of several days into one summary.
+    Counts are added up, the truck percentage is recomputed from the totals,
+    the scooter percentage and bicycle average are weighted by day, and the
+    peak hour is the busiest hour of any day.
+    :param daily: dict of file path -> outcomes
+    """
+    summary = {"Days processed": len(daily)}
+    for key in SUMMED_OUTCOMES:
+        summary[key] = sum(outcomes[key] for outcomes in daily.values())
+
+    total = summary["Total vehicles"]
+    elm_avenue = summary["Vehicles at Elm Avenue/Rabbit Road"]
+    summary["Percentage of trucks"] = round(summary["Total trucks"] / total * 100) if total else 0
+    summary["Percentage of scooters at Elm Avenue/Rabbit Road"] = round(sum(
+        outcomes["Percentage of scooters at Elm Avenue/Rabbit Road"] * outcomes["Vehicles at Elm Avenue/Rabbit Road"]
+        for outcomes in daily.values()
+    ) / elm_avenue) if elm_avenue else 0
+    summary["Average bicycles per hour"] = round(sum(
+        outcomes["Average bicycles per hour"] for outcomes in daily.values()
+    ) / len(daily)) if daily else 0
+
+    peak = max((outcomes["Peak hour traffic at Hanley Highway/Westway"] for outcomes in daily.values()), default=0)
+    summary["Peak hour traffic at Hanley Highway/Westway"] = peak
+    summary["Peak hour(s) at Hanley Highway/Westway"] = [
+        f"{file_date(path)} {hour}"
+        for path, outcomes in daily.items()
+        if outcomes["Peak hour traffic at Hanley Highway/Westway"] == peak
+        for hour in outcomes["Peak hour(s) at Hanley Highway/Westway"]
+    ]
+    return summary
+
+
+@PROFILER.timed("save")
+def write_results(daily, summary, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for path, outcomes in daily.items():
+        name = os.path.splitext(os.path.basename(path))[0] + ".json"
+        with open(os.path.join(output_dir, name), "w") as file:
+            json.dump(outcomes, file, indent=2)
+    with open(os.path.join(output_dir, "summary.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+
+
+def add_source_arguments(parser):
+    """
+    --start/--end, --glob and --data-dir: which traffic files to work on
+    """
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--start", help="first date, DD/MM/YYYY (use with --end)")
+    source.add_argument("--glob", help='file pattern, e.g. "traffic_data*2024.csv"')
+    parser.add_argument("--end", help="last date, DD/MM/YYYY (inclusive)")
+    parser.add_argument("--data-dir", default=".", help="folder holding the CSV files")
+
+
+def source_paths(parser, args):
+    """
+    :return: the existing files selected by add_source_arguments(), in date order
+    """
+    if args.start and not args.end:
+        parser.error("--start needs --end")
+    if args.glob:
+        return sorted(glob.glob(os.path.join(args.data_dir, args.glob)), key=date_order)
+    return [path for path in files_for_date_range(args.start, args.end, args.data_dir) if os.path.exists(path)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process many traffic data files in parallel.")
+    add_source_arguments(parser)
+    parser.add_argument("--output-dir", default="batch_results", help="folder for the JSON results")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="result cache folder")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the CSV files")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    paths = source_paths(parser, args)
+    if not paths:
+        print("No traffic data files found.")
+        return
+
+    daily = process_files(paths, args.workers, None if args.no_cache else args.cache_dir)
+    summary = merge_outcomes(daily)
+    write_results(daily, summary, args.output_dir)
+
+    print(f"Processed {len(daily)} of {len(paths)} file(s), results written to {args.output_dir}")
+    display_outcomes(summary)
+
+
+if __name__ == "__main__":
+    main()
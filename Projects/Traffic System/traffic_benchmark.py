@@ -0,0 +1,163 @@
+# Throughput benchmark for the traffic analyzer.
+#
+# For every row count, a seeded synthetic day is generated (and kept in the
+# work folder for later runs), then processed in a fresh Python process so
+# that the peak RSS belongs to that size alone. Reported per size:
+#   rows/sec of process_csv_data, peak RSS, and the time of each stage
+#   (parse, aggregate, outcomes, histograms, save).
+#
+# The numbers are compared with benchmark_baseline.json; the run fails
+# (exit code 1) if throughput drops or memory grows beyond --tolerance.
+#
+#   python traffic_benchmark.py --rows 10000 100000 1000000 --save-baseline
+#   python traffic_benchmark.py --rows 10000 100000 1000000
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from traffic_profile import peak_rss_mb
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "traffic_benchmark")
+BENCHMARK_DATE = datetime(2024, 1, 1)
+
+
+def data_file(rows, seed, work_dir):
+    """
+    Path of the synthetic day for this size, generated on first use
+    """
+    from generate_traffic_data import generate
+
+    file_path = os.path.join(work_dir, f"rows{rows}_seed{seed}", "traffic_data01012024.csv")
+    if not os.path.exists(file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        generate(file_path, rows, BENCHMARK_DATE, seed)
+    return file_path
+
+
+def measure(file_path):
+    """
+    Time every stage of processing one file (run in its own process)
+    """
+    from Traffic import compute_outcomes, hourly_histograms, save_results_to_file
+    from traffic_columns import read_csv_columns
+    from traffic_cube import TrafficCube
+
+    stages = {}
+
+    start = time.perf_counter()
+    columns = read_csv_columns(file_path)
+    stages["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cube = TrafficCube.from_columns(columns)
+    stages["aggregate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outcomes = compute_outcomes(cube)
+    stages["outcomes"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hourly_histograms(cube)
+    stages["histograms"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        save_results_to_file(outcomes, os.path.join(folder, "results.txt"))
+        stages["save"] = time.perf_counter() - start
+
+    rows = len(columns)
+    process_seconds = stages["parse"] + stages["aggregate"] + stages["outcomes"]
+    return {
+        "rows": rows,
+        "rows_per_sec": rows / process_seconds if process_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def run_size(rows, seed, work_dir):
+    file_path = data_file(rows, seed, work_dir)
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", file_path],
+        check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output)
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of regressions against the baseline
+    """
+    regressions = []
+    for rows, result in results.items():
+        previous = baseline.get(rows)
+        if previous is None:
+            continue
+        if result["rows_per_sec"] < previous["rows_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{rows} rows: {result['rows_per_sec']:,.0f} rows/sec, baseline {previous['rows_per_sec']:,.0f}"
+            )
+        if None in (result["peak_rss_mb"], previous["peak_rss_mb"]):
+            continue  # memory is not measured on this platform
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{rows} rows: peak RSS {result['peak_rss_mb']:.0f} MB, baseline {previous['peak_rss_mb']:.0f} MB"
+            )
+    return regressions
+
+
+def print_report(results):
+    print(f"{'rows':>12} {'rows/sec':>12} {'peak MB':>8}  stages (ms)")
+    for rows, result in results.items():
+        stages = "  ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in result["stages"].items())
+        peak = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        print(f"{int(rows):>12,} {result['rows_per_sec']:>12,.0f} {peak:>8}  {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the traffic analyzer on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="row counts to benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="where the synthetic files are kept")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / memory growth")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+        return 0
+
+    results = {str(rows): run_size(rows, args.seed, args.work_dir) for rows in args.rows}
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline yet; run again with --save-baseline to record one.")
+        return 0
+    with open(args.baseline, "r") as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("\nNo regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
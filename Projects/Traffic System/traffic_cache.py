@@ -0,0 +1,222 @@
+# Persistent, content-addressed cache of processed traffic files.
+#
+# Results are stored under the SHA-256 of the CSV contents, so a renamed or
+# copied file still hits. A small record per file path remembers the size,
+# mtime and hash seen last time: if the file has not changed, a lookup costs
+# one os.stat() and one small JSON read, without hashing or parsing the CSV.
+#
+#   <cache_dir>/paths/<sha1 of the absolute path>.json
+#   <cache_dir>/results/<sha256 of the contents>.json
+#
+# Every result records the version it was computed with: METRICS_VERSION, a
+# hash of the metric specs in Traffic.py, plus RESULT_FORMAT. Whenever an
+# outcome is added, removed or computed differently, every older result
+# becomes a miss and is removed. Least recently used results are evicted
+# past max_bytes, together with the path records that led to them.
+# Each result also keeps the outcomes of every junction and the file's
+# SpeedSketch, so speed percentiles over many days are combined from the
+# cache without parsing the CSVs again.
+
+import hashlib
+import json
+import os
+
+from Traffic import METRICS_VERSION as OUTCOMES_VERSION, compute_outcomes, hourly_histograms, junction_outcomes
+from traffic_parallel import load_cube
+from traffic_profile import PROFILER
+from traffic_sketch import SpeedSketch
+
+DEFAULT_CACHE_DIR = ".traffic_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+HASH_BLOCK_BYTES = 1024 * 1024
+# Bump when the layout of a stored result changes (histograms, sketches, ...)
+RESULT_FORMAT = 1
+METRICS_VERSION = f"{RESULT_FORMAT}-{OUTCOMES_VERSION}"
+
+
+@PROFILER.timed("hash")
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json(path, data):
+    # Write to a temporary file and rename, so readers in other processes
+    # never see a half-written entry
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.paths_dir = os.path.join(cache_dir, "paths")
+        self.results_dir = os.path.join(cache_dir, "results")
+        os.makedirs(self.paths_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    def content_key(self, file_path):
+        """
+        SHA-256 of the file, reusing the recorded one while size and mtime are unchanged
+        """
+        stat = os.stat(file_path)
+        name = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest() + ".json"
+        record_path = os.path.join(self.paths_dir, name)
+
+        record = read_json(record_path)
+        if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["sha256"]
+
+        sha256 = file_hash(file_path)
+        write_json(record_path, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256})
+        return sha256
+
+    def entry(self, file_path):
+        """
+        :return: the result dict stored for this file's contents, or None
+        """
+        result_path = os.path.join(self.results_dir, self.content_key(file_path) + ".json")
+        entry = read_json(result_path)
+        if entry is None or entry.get("metrics_version") != METRICS_VERSION:
+            PROFILER.count("cache_misses")
+            if entry is not None:
+                try:
+                    os.remove(result_path)
+                except FileNotFoundError:
+                    pass  # already evicted by another process
+            return None
+        PROFILER.count("cache_hits")
+
+        # Mark as recently used for the eviction order
+        try:
+            os.utime(result_path)
+        except FileNotFoundError:
+            pass  # evicted since it was read; the entry itself is still good
+        return entry
+
+    def lookup(self, file_path):
+        """
+        :return: (outcomes, histograms) stored for this file's contents, or None
+        """
+        entry = self.entry(file_path)
+        return (entry["outcomes"], entry["histograms"]) if entry is not None else None
+
+    def store(self, file_path, cube):
+        """
+        Compute and store everything kept for a file from its cube
+        :return: the stored result dict
+        """
+        result_path = os.path.join(self.results_dir, self.content_key(file_path) + ".json")
+        entry = {
+            "metrics_version": METRICS_VERSION,
+            "outcomes": compute_outcomes(cube),
+            "histograms": hourly_histograms(cube),
+            "junctions": junction_outcomes(cube),
+            "speeds": cube.speeds.to_json(),
+        }
+        with PROFILER.stage("save"):
+            write_json(result_path, entry)
+        self.evict()
+        return entry
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache fits in max_bytes
+        """
+        entries = []
+        for entry in os.scandir(self.results_dir):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = False
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted = True
+        if evicted:
+            self.evict_records()
+
+    def evict_records(self):
+        """
+        Remove the path records whose result is no longer stored
+        """
+        kept = {name[:-len(".json")] for name in os.listdir(self.results_dir) if name.endswith(".json")}
+        for entry in os.scandir(self.paths_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            record = read_json(entry.path)
+            if record is None or record.get("sha256") not in kept:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def results(self, file_path, workers=1):
+        """
+        Everything kept for a traffic file, from the cache when possible.
+        :param workers: processes used to parse a large file on a miss (None = one per core)
+        :return: dict with "outcomes", "histograms", "junctions" (outcomes per junction)
+            and "speeds" (SpeedSketch.to_json()), or None if the file cannot be processed
+        """
+        if not os.path.exists(file_path):
+            print(f"File {file_path} does not exist.")
+            return None
+
+        entry = self.entry(file_path)
+        if entry is not None:
+            return entry
+
+        cube = load_cube(file_path, workers)
+        return self.store(file_path, cube) if cube is not None else None
+
+    def process(self, file_path, workers=1):
+        """
+        Outcomes and hourly histograms of a traffic file, from the cache when possible.
+        :return: (outcomes, histograms), or (None, None) if the file cannot be processed
+        """
+        entry = self.results(file_path, workers)
+        return (entry["outcomes"], entry["histograms"]) if entry is not None else (None, None)
+
+    def junctions(self, file_path, workers=1):
+        """
+        :return: dict of junction -> outcomes for every junction of the file, or None
+        """
+        entry = self.results(file_path, workers)
+        return entry["junctions"] if entry is not None else None
+
+    def speed_sketch(self, file_path, workers=1):
+        """
+        Speed distribution of a traffic file, from the cache when possible.
+        :return: SpeedSketch, or None if the file cannot be processed
+        """
+        entry = self.results(file_path, workers)
+        return SpeedSketch.from_json(entry["speeds"]) if entry is not None else None
+
+
+def cached_outcomes(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    process_csv_data() through the cache; usable as a worker function
+    """
+    return ResultCache(cache_dir).process(file_path)[0]
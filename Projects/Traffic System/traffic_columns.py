@@ -0,0 +1,539 @@
+# Columnar, dictionary-encoded storage for the traffic CSV files.
+#
+# Every repeated string column is stored as small integer codes in a typed
+# array, with one list per column that maps a code back to its string.
+# Numeric columns are stored as numeric arrays, so the outcomes can be
+# computed with numpy masks and counts instead of Python loops over dicts.
+#
+# The columns of a day can also be written to a binary .tcol file next to
+# the CSV. Reopening that file memory-maps the columns instead of parsing
+# text, so a day that was converted once loads almost instantly:
+#
+#   python traffic_columns.py traffic_data*.csv            # convert
+#   python traffic_columns.py --verify traffic_data*.csv   # convert and check
+#
+# Rows that cannot be stored (wrong number of fields, a speed that is not a
+# whole number, an impossible time of day, ...) are not fatal: they are left
+# out of the columns and written, with the reason, to a side file
+# rejected_traffic_dataDDMMYYYY.csv next to the CSV.
+#
+# .tcol layout (little-endian):
+#   8 bytes   magic b"TRAFCOL3", its digit the format version
+#   8 bytes   header length (uint64)
+#   header    UTF-8 JSON: row count, source CSV size/mtime, string
+#             dictionaries, number of rejected rows (the rows themselves
+#             are in the rejected_*.csv file), and dtype/offset of every column
+#   columns   raw fixed-width arrays, each starting on a 64-byte boundary
+
+import argparse
+import json
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from traffic_profile import PROFILER, add_profile_argument, start_profiling
+
+REQUIRED_COLUMNS = [
+    "JunctionName", "Date", "timeOfDay", "travel_Direction_in", "travel_Direction_out",
+    "Weather_Conditions", "JunctionSpeedLimit", "VehicleSpeed", "VehicleType", "elctricHybrid"
+]
+
+# String columns stored as codes. Both travel directions share one
+# dictionary so their codes can be compared with each other directly.
+CATEGORY_COLUMNS = {
+    "JunctionName": "JunctionName",
+    "VehicleType": "VehicleType",
+    "Weather_Conditions": "Weather_Conditions",
+    "travel_Direction_in": "direction",
+    "travel_Direction_out": "direction",
+    "elctricHybrid": "elctricHybrid",
+}
+
+
+# Size hint for each batch of lines read from the CSV
+BATCH_BYTES = 1024 * 1024
+
+# Bump the version digit whenever the columns or the header change; files of
+# an older version are then converted again the next time their day is loaded.
+# Version 2 added the seconds column, version 3 keeps only the number of
+# rejected rows in the header.
+BINARY_MAGIC = b"TRAFCOL3"
+BINARY_EXTENSION = ".tcol"
+BINARY_ALIGN = 64
+
+QUARANTINE_PREFIX = "rejected_"
+# Speeds are stored as int16
+MAX_SPEED = int(np.iinfo(np.int16).max)
+
+
+class TrafficColumns:
+
+    def __init__(self, codes, values, speed, speed_limit, hour, seconds, rejected=None, rejected_count=None):
+        self.codes = codes              # column name -> uint16 code array
+        self.values = values            # column name -> list of strings, indexed by code
+        self.speed = speed              # int16 VehicleSpeed
+        self.speed_limit = speed_limit  # int16 JunctionSpeedLimit
+        self.hour = hour                # int8 hour taken from timeOfDay
+        self.seconds = seconds          # int32 seconds since midnight taken from timeOfDay
+        self.rejected = rejected or []  # (reason, line) of every row left out; empty when read from a .tcol file
+        # Number of rows left out, also known for a .tcol file
+        self.rejected_count = len(self.rejected) if rejected_count is None else rejected_count
+
+    def __len__(self):
+        return len(self.hour)
+
+    def code(self, column, value):
+        """
+        :return: the code of value in column, or -1 if it never occurs
+        """
+        try:
+            return self.values[column].index(value)
+        except ValueError:
+            return -1
+
+    def mask(self, column, *values):
+        """
+        Boolean mask of the rows where column holds any of the given values
+        """
+        wanted = [self.code(column, value) for value in values]
+        wanted = [code for code in wanted if code >= 0]
+        if not wanted:
+            return np.zeros(len(self), dtype=bool)
+        if len(wanted) == 1:
+            return self.codes[column] == wanted[0]
+        return np.isin(self.codes[column], wanted)
+
+    def hourly_counts(self, mask=None):
+        """
+        Number of rows per hour (0 - 23), optionally only where mask is True
+        """
+        hours = self.hour if mask is None else self.hour[mask]
+        return np.bincount(hours, minlength=24)
+
+    def arrays(self):
+        """
+        :return: dict of name -> numpy array for every stored column
+        """
+        arrays = dict(self.codes)
+        arrays["VehicleSpeed"] = self.speed
+        arrays["JunctionSpeedLimit"] = self.speed_limit
+        arrays["hour"] = self.hour
+        arrays["seconds"] = self.seconds
+        return arrays
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.arrays().values())
+
+
+def parse_times(times):
+    """
+    Hour and seconds since midnight of "H:MM:SS" / "HH:MM:SS" strings, parsed on the characters
+    :return: (int8 array of hours, int32 array of seconds, boolean mask of the well-formed times)
+    """
+    # Nine characters: one more than a valid time, so longer strings show up as invalid
+    chars = np.array(times, dtype="U9").view(np.uint32).reshape(len(times), 9).astype(np.int32)
+    # Give "H:MM:SS" the layout of "HH:MM:SS"
+    one_digit = chars[:, 1] == ord(":")
+    chars[one_digit, 1:] = chars[one_digit, :-1]
+    chars[one_digit, 0] = ord("0")
+
+    digits = chars[:, [0, 1, 3, 4, 6, 7]] - ord("0")
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    valid &= (chars[:, 2] == ord(":")) & (chars[:, 5] == ord(":")) & (chars[:, 8] == 0)
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    valid &= (hours <= 23) & (digits[:, 2] <= 5) & (digits[:, 4] <= 5)
+    seconds = hours * 3600 + (digits[:, 2] * 10 + digits[:, 3]) * 60 + digits[:, 4] * 10 + digits[:, 5]
+    return np.where(valid, hours, 0).astype(np.int8), np.where(valid, seconds, 0).astype(np.int32), valid
+
+
+def whole_number(text):
+    """
+    int() that also takes a whole number written as a decimal, e.g. "45.0"
+    :raise ValueError: if text is not a whole number
+    """
+    try:
+        return int(text)
+    except ValueError:
+        value = float(text)
+        if not value.is_integer():
+            raise
+        return int(value)
+
+
+def row_problem(fields, width, speed_i, limit_i, time_i):
+    """
+    :return: why a row (list of fields) cannot be stored, or None if it can
+    """
+    if len(fields) != width:
+        return f"expected {width} fields, found {len(fields)}"
+    for name, i in (("VehicleSpeed", speed_i), ("JunctionSpeedLimit", limit_i)):
+        try:
+            value = whole_number(fields[i])
+        except (ValueError, OverflowError):
+            return f"{name} {fields[i]!r} is not a whole number"
+        if not 0 <= value <= MAX_SPEED:
+            return f"{name} {value} is out of range"
+    if not parse_times([fields[time_i]])[2][0]:
+        return f"timeOfDay {fields[time_i]!r} is not a valid time"
+    return None
+
+
+def convert_batch(flat, width, speed_i, limit_i, time_i):
+    """
+    Typed numeric columns of a batch of rows: (speed, speed limit, hour, seconds) arrays.
+    :raise ValueError: if any row of the batch cannot be stored
+    """
+    try:
+        try:
+            speed = array("h", map(int, flat[speed_i::width]))
+            speed_limit = array("h", map(int, flat[limit_i::width]))
+        except ValueError:
+            # Slower, for files that write whole speeds as decimals ("45.0")
+            speed = array("h", map(whole_number, flat[speed_i::width]))
+            speed_limit = array("h", map(whole_number, flat[limit_i::width]))
+    except OverflowError as error:
+        raise ValueError(error)
+    speed = np.frombuffer(speed, dtype=np.int16)
+    speed_limit = np.frombuffer(speed_limit, dtype=np.int16)
+    hour, seconds, valid = parse_times(flat[time_i::width])
+    if not valid.all() or (speed < 0).any() or (speed_limit < 0).any():
+        raise ValueError("invalid value in batch")
+    return speed, speed_limit, hour, seconds
+
+
+def validate_batch(chunk, flat, width, speed_i, limit_i, time_i, rejected):
+    """
+    Convert a batch of lines (chunk, already split into flat fields). If some
+    line is malformed, the batch is checked line by line: bad lines are added
+    to `rejected` as (reason, line) and the rest is converted.
+    :return: (flat fields of the good lines, convert_batch() arrays), or (None, None) if no line is good
+    """
+    try:
+        if len(flat) != chunk.count("\n") * width:
+            raise ValueError("wrong number of fields in batch")
+        return flat, convert_batch(flat, width, speed_i, limit_i, time_i)
+    except ValueError:
+        pass
+
+    lines = []
+    for line in chunk.replace("\r", "").splitlines():
+        if not line:
+            continue
+        problem = row_problem(line.split(","), width, speed_i, limit_i, time_i)
+        if problem is None:
+            lines.append(line)
+        else:
+            rejected.append((problem, line))
+    if not lines:
+        return None, None
+    flat = ",".join(lines).split(",")
+    return flat, convert_batch(flat, width, speed_i, limit_i, time_i)
+
+
+def load_columns(file_path):
+    """
+    Columns of a traffic CSV, from its .tcol file when that is up to date.
+    :return: TrafficColumns, or None if the file is missing or malformed
+    """
+    binary_path = binary_path_for(file_path)
+    if os.path.exists(binary_path) and os.path.exists(file_path):
+        columns = open_binary(binary_path, file_path)
+        if columns is not None:
+            return columns
+    columns = read_csv_columns(file_path)
+    if columns is not None:
+        quarantine(file_path, columns.rejected)
+        if outdated_binary(binary_path):
+            save_binary(columns, binary_path, file_path)
+    return columns
+
+
+def read_csv_columns(file_path, start=None, end=None):
+    """
+    Read a traffic CSV once into a TrafficColumns store. Malformed rows are
+    left out and listed in its `rejected` (see quarantine()).
+    :param start, end: optional byte range of the data to read; both must be
+        at the start of a line (see traffic_parallel.split_ranges)
+    :return: TrafficColumns, or None if the file is missing or malformed
+    """
+    try:
+        file = open(file_path, "rb")
+    except FileNotFoundError:
+        print(f"File {file_path} does not exist.")
+        return None
+
+    with file:
+        headers = file.readline().decode("utf-8").strip().split(",")
+        if not all(col in headers for col in REQUIRED_COLUMNS):
+            print("CSV file does not have the required format.")
+            return None
+        if start is not None:
+            file.seek(start)
+        remaining = float("inf") if end is None else end - file.tell()
+
+        dictionaries = {name: {} for name in set(CATEGORY_COLUMNS.values())}
+        category = [
+            (headers.index(column), dictionaries[shared], array("H"))
+            for column, shared in CATEGORY_COLUMNS.items()
+        ]
+        time_i = headers.index("timeOfDay")
+        limit_i = headers.index("JunctionSpeedLimit")
+        speed_i = headers.index("VehicleSpeed")
+        speed, speed_limit, hour, seconds = array("h"), array("h"), array("b"), array("i")
+        rejected = []
+
+        # Read in large batches and split each batch into one flat list of
+        # fields; column i is then the slice flat[i::width]. No list or dict
+        # is created per row, and each column is converted in one call.
+        width = len(headers)
+        while remaining > 0:
+            with PROFILER.stage("read"):
+                data = file.read(min(BATCH_BYTES, remaining))
+                remaining -= len(data)
+                if data and not data.endswith(b"\n") and remaining > 0:
+                    line_end = file.readline()
+                    data += line_end
+                    remaining -= len(line_end)
+            if not data:
+                break
+            PROFILER.count("bytes_read", len(data))
+
+            with PROFILER.stage("parse"):
+                chunk = data.decode("utf-8")
+                if not chunk.endswith("\n"):
+                    chunk += "\n"
+                flat = chunk.replace("\r", "").replace("\n", ",").split(",")[:-1]
+            with PROFILER.stage("validate"):
+                flat, batch = validate_batch(chunk, flat, width, speed_i, limit_i, time_i, rejected)
+            if batch is None:
+                continue
+
+            with PROFILER.stage("encode"):
+                for index, dictionary, codes in category:
+                    column = flat[index::width]
+                    for value in set(column).difference(dictionary):
+                        dictionary[value] = len(dictionary)
+                    codes.extend(map(dictionary.__getitem__, column))
+                speed.frombytes(batch[0].tobytes())
+                speed_limit.frombytes(batch[1].tobytes())
+                hour.frombytes(batch[2].tobytes())
+                seconds.frombytes(batch[3].tobytes())
+
+    PROFILER.count("csv_reads")
+    PROFILER.count("rows", len(hour))
+    PROFILER.count("rejected_rows", len(rejected))
+    codes, values = {}, {}
+    for column, (_, dictionary, column_codes) in zip(CATEGORY_COLUMNS, category):
+        codes[column] = np.frombuffer(column_codes, dtype=np.uint16)
+        values[column] = list(dictionary)
+
+    return TrafficColumns(
+        codes,
+        values,
+        np.frombuffer(speed, dtype=np.int16),
+        np.frombuffer(speed_limit, dtype=np.int16),
+        np.frombuffer(hour, dtype=np.int8),
+        np.frombuffer(seconds, dtype=np.int32),
+        rejected,
+    )
+
+
+def quarantine_path_for(file_path):
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, QUARANTINE_PREFIX + name)
+
+
+def quarantine(file_path, rejected, append=False):
+    """
+    Write the rejected rows of a CSV to its side file, reason first and the
+    original line unchanged. Without rejected rows an old side file is removed.
+    :param append: add to the side file instead of replacing it (live mode)
+    :return: path of the side file, or None if there is nothing to report
+    """
+    path = quarantine_path_for(file_path)
+    if not rejected:
+        if not append and os.path.exists(path):
+            os.remove(path)
+        return None
+
+    write_header = not append or not os.path.exists(path)
+    with open(path, "a" if append else "w", encoding="utf-8") as file:
+        if write_header:
+            with open(file_path, "r", encoding="utf-8") as source:
+                file.write("reason," + source.readline().rstrip("\r\n") + "\n")
+        for reason, line in rejected:
+            reason = reason.replace('"', '""')
+            file.write(f'"{reason}",{line}\n')
+    print(f"Skipped {len(rejected)} malformed row(s) of {file_path}; see {path}")
+    return path
+
+
+def binary_path_for(file_path):
+    return os.path.splitext(file_path)[0] + BINARY_EXTENSION
+
+
+def save_binary(columns, binary_path, source_path=None):
+    """
+    Write columns to a .tcol file. source_path is the CSV the columns came
+    from; its size and mtime are recorded so stale files can be detected.
+    """
+    arrays = columns.arrays()
+    header = {
+        "rows": len(columns),
+        "source": None,
+        "values": columns.values,
+        "rejected_rows": columns.rejected_count,
+        "columns": {},
+    }
+    if source_path is not None:
+        stat = os.stat(source_path)
+        header["source"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Offsets are relative to the start of the data section
+    offset = 0
+    for name, column in arrays.items():
+        header["columns"][name] = {"dtype": column.dtype.str, "offset": offset}
+        offset += -(-column.nbytes // BINARY_ALIGN) * BINARY_ALIGN
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(BINARY_MAGIC) + 8 + len(header_bytes)
+    data_start += -data_start % BINARY_ALIGN
+
+    temp_path = f"{binary_path}.{os.getpid()}.tmp"
+    with PROFILER.stage("save"), open(temp_path, "wb") as file:
+        file.write(BINARY_MAGIC)
+        file.write(struct.pack("<Q", len(header_bytes)))
+        file.write(header_bytes)
+        for name, column in arrays.items():
+            file.seek(data_start + header["columns"][name]["offset"])
+            file.write(np.ascontiguousarray(column).tobytes())
+    os.replace(temp_path, binary_path)
+
+
+def outdated_binary(binary_path):
+    """
+    :return: True if binary_path is a .tcol file written by an older version of this module
+    """
+    try:
+        with open(binary_path, "rb") as file:
+            magic = file.read(len(BINARY_MAGIC))
+    except OSError:
+        return False
+    return magic != BINARY_MAGIC and magic[:-1] == BINARY_MAGIC[:-1]
+
+
+def open_binary(binary_path, source_path=None):
+    """
+    Memory-map a .tcol file; the returned arrays are read-only views of the file.
+    :return: TrafficColumns, or None if the file is not valid or is older than source_path
+    """
+    with PROFILER.stage("read"), open(binary_path, "rb") as file:
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            return None
+        (header_length,) = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(header_length).decode("utf-8"))
+
+    if source_path is not None:
+        stat = os.stat(source_path)
+        if header["source"] != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+            return None
+
+    data_start = len(BINARY_MAGIC) + 8 + header_length
+    data_start += -data_start % BINARY_ALIGN
+    rows = header["rows"]
+    PROFILER.count("binary_reads")
+    PROFILER.count("rows", rows)
+    raw = np.memmap(binary_path, dtype=np.uint8, mode="r")
+
+    arrays = {}
+    for name, spec in header["columns"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = data_start + spec["offset"]
+        arrays[name] = raw[start:start + rows * dtype.itemsize].view(dtype)
+
+    return TrafficColumns(
+        {column: arrays[column] for column in CATEGORY_COLUMNS},
+        header["values"],
+        arrays["VehicleSpeed"],
+        arrays["JunctionSpeedLimit"],
+        arrays["hour"],
+        arrays["seconds"],
+        rejected_count=header["rejected_rows"],
+    )
+
+
+def convert(file_path):
+    """
+    Parse a CSV and write its .tcol file next to it.
+    :return: path of the .tcol file, or None if the CSV could not be read
+    """
+    columns = read_csv_columns(file_path)
+    if columns is None:
+        return None
+    quarantine(file_path, columns.rejected)
+    binary_path = binary_path_for(file_path)
+    save_binary(columns, binary_path, file_path)
+    return binary_path
+
+
+def verify_round_trip(file_path):
+    """
+    Check that the .tcol file gives the same columns, outcomes and
+    histograms as parsing the CSV itself.
+    :return: list of differences (empty when the round trip is exact)
+    """
+    # Imported here: Traffic.py loads its data through this module
+    from Traffic import compute_outcomes, hourly_histograms
+    from traffic_cube import TrafficCube
+
+    from_csv = read_csv_columns(file_path)
+    from_binary = open_binary(binary_path_for(file_path), file_path)
+    if from_csv is None or from_binary is None:
+        return ["could not open both the CSV and an up to date .tcol file"]
+
+    problems = []
+    if from_csv.values != from_binary.values:
+        problems.append("string dictionaries differ")
+    if from_csv.rejected_count != from_binary.rejected_count:
+        problems.append("numbers of rejected rows differ")
+    for name, column in from_csv.arrays().items():
+        if not np.array_equal(column, from_binary.arrays()[name]):
+            problems.append(f"column {name} differs")
+
+    csv_cube = TrafficCube.from_columns(from_csv)
+    binary_cube = TrafficCube.from_columns(from_binary)
+    if compute_outcomes(csv_cube) != compute_outcomes(binary_cube):
+        problems.append("outcomes differ")
+    if hourly_histograms(csv_cube) != hourly_histograms(binary_cube):
+        problems.append("histograms differ")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert traffic CSV files to memory-mappable .tcol files.")
+    parser.add_argument("files", nargs="+", help="traffic_dataDDMMYYYY.csv files")
+    parser.add_argument("--verify", action="store_true", help="check each converted file against its CSV")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    failed = False
+    for file_path in args.files:
+        binary_path = convert(file_path)
+        if binary_path is None:
+            failed = True
+            continue
+        print(f"{file_path} -> {binary_path}")
+        if args.verify:
+            problems = verify_round_trip(file_path)
+            for problem in problems:
+                print(f"  {problem}")
+            failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+# Pre-aggregated count cube: junction x hour x vehicle type x weather.
+#
+# The cube is filled once per file with np.bincount over the encoded columns.
+# Every outcome and histogram is then a slice and a sum of the cube, and any
+# other combination (e.g. scooters per hour at one junction in the rain) can
+# be read off the cube without going back to the rows.
+
+import numpy as np
+
+from traffic_profile import PROFILER
+from traffic_sketch import SpeedSketch
+from traffic_windows import TrafficFlow
+
+HOURS = 24
+
+
+def electric_mask(columns):
+    electric = [value for value in columns.values["elctricHybrid"] if value.lower() == "true"]
+    return columns.mask("elctricHybrid", *electric)
+
+
+# What is counted in every cell: measure name -> function giving the boolean
+# mask of the rows it counts ("vehicles" counts every row). All measures are
+# filled in the same build, so a new one costs no extra pass over the file.
+MEASURES = {
+    "vehicles": None,
+    "electric": electric_mask,
+    "straight": lambda columns: columns.codes["travel_Direction_in"] == columns.codes["travel_Direction_out"],
+    "heading_north": lambda columns: columns.mask("travel_Direction_out", "N"),
+    "over_limit": lambda columns: columns.speed > columns.speed_limit,
+}
+
+# Cube axis of each dimension a filter or group-by can name
+AXES = {"junction": 0, "hour": 1, "vehicle_type": 2, "weather": 3}
+
+# Values added up per cell besides the counts (cube attributes of the counts' shape)
+SUMS = ["speed_sum"]
+
+
+def register_measure(name, mask):
+    """
+    Count another kind of row in every cell, e.g.
+    register_measure("fast", lambda columns: columns.speed > 60)
+
+    Only cubes built afterwards count it, and pool workers only know it if
+    it is registered when the module defining it is imported.
+    """
+    MEASURES[name] = mask
+
+
+class TrafficCube:
+
+    def __init__(self, junctions, vehicle_types, weathers, measures, counts, speed_sum, speed_max, speeds, flow):
+        self.junctions = junctions          # labels of axis 0
+        self.vehicle_types = vehicle_types  # labels of axis 2
+        self.weathers = weathers            # labels of axis 3
+        self.measures = measures            # names of the last axis of counts, MEASURES when the cube was built
+        self.counts = counts                # int64, shape (junctions, 24, vehicle types, weathers, measures)
+        self.speed_sum = speed_sum          # int64, sum of VehicleSpeed per cell (junctions, 24, vehicle types, weathers)
+        self.speed_max = speed_max          # int64, highest VehicleSpeed per cell, 0 when the cell is empty
+        self.speeds = speeds                # SpeedSketch, speed distribution per junction and hour
+        self.flow = flow                    # TrafficFlow, vehicles per 5 minutes per junction and direction
+
+    @classmethod
+    @PROFILER.timed("aggregate")
+    def from_columns(cls, columns):
+        junctions = columns.values["JunctionName"]
+        vehicle_types = columns.values["VehicleType"]
+        weathers = columns.values["Weather_Conditions"]
+        shape = (len(junctions), HOURS, len(vehicle_types), len(weathers))
+        cells = int(np.prod(shape))
+
+        # Flat cell index of every row
+        cell = columns.codes["JunctionName"].astype(np.intp)
+        cell = cell * HOURS + columns.hour
+        cell = cell * len(vehicle_types) + columns.codes["VehicleType"]
+        cell = cell * len(weathers) + columns.codes["Weather_Conditions"]
+
+        measures = list(MEASURES)
+        counts = np.empty(shape + (len(measures),), dtype=np.int64)
+        for i, mask in enumerate(MEASURES[measure] for measure in measures):
+            rows = cell if mask is None else cell[mask(columns)]
+            counts[..., i] = np.bincount(rows, minlength=cells).reshape(shape)
+
+        speed_sum = np.bincount(cell, weights=columns.speed, minlength=cells).astype(np.int64).reshape(shape)
+        speed_max = np.zeros(cells, dtype=np.int64)
+        np.maximum.at(speed_max, cell, columns.speed)
+        return cls(list(junctions), list(vehicle_types), list(weathers), measures, counts, speed_sum,
+                   speed_max.reshape(shape), SpeedSketch.from_columns(columns), TrafficFlow.from_columns(columns))
+
+    @classmethod
+    @PROFILER.timed("merge")
+    def merge(cls, cubes):
+        """
+        Add up cubes built from different parts of the data. Each part has its
+        own label order, so the labels are unioned and every cube is added
+        into its positions of the combined cube. Only the measures counted in
+        every cube are kept.
+        """
+        junctions, vehicle_types, weathers = [], [], []
+        for cube in cubes:
+            junctions += [label for label in cube.junctions if label not in junctions]
+            vehicle_types += [label for label in cube.vehicle_types if label not in vehicle_types]
+            weathers += [label for label in cube.weathers if label not in weathers]
+        measures = [measure for measure in MEASURES if all(measure in cube.measures for cube in cubes)]
+
+        shape = (len(junctions), HOURS, len(vehicle_types), len(weathers))
+        counts = np.zeros(shape + (len(measures),), dtype=np.int64)
+        speed_sum = np.zeros(shape, dtype=np.int64)
+        speed_max = np.zeros(shape, dtype=np.int64)
+        for cube in cubes:
+            cells = np.ix_(
+                [junctions.index(label) for label in cube.junctions],
+                range(HOURS),
+                [vehicle_types.index(label) for label in cube.vehicle_types],
+                [weathers.index(label) for label in cube.weathers],
+            )
+            counts[cells] += cube.counts[..., [cube.measures.index(measure) for measure in measures]]
+            speed_sum[cells] += cube.speed_sum
+            speed_max[cells] = np.maximum(speed_max[cells], cube.speed_max)
+        speeds = SpeedSketch.merge([cube.speeds for cube in cubes])
+        flow = TrafficFlow.merge([cube.flow for cube in cubes])
+        return cls(junctions, vehicle_types, weathers, measures, counts, speed_sum, speed_max, speeds, flow)
+
+    def labels(self, dimension):
+        """
+        :param dimension: "junction", "hour", "vehicle_type" or "weather"
+        """
+        if dimension == "hour":
+            return list(range(HOURS))
+        return {"junction": self.junctions, "vehicle_type": self.vehicle_types, "weather": self.weathers}[dimension]
+
+    @staticmethod
+    def _indices(labels, wanted):
+        if isinstance(wanted, (str, int)):
+            wanted = [wanted]
+        return [labels.index(value) for value in wanted if value in labels]
+
+    def select(self, measure="vehicles", junction=None, hour=None, vehicle_type=None, weather=None):
+        """
+        Sub-cube of one measure, or of one of the SUMS. Each filter is None
+        (everything), one label or a list of labels; labels that never occur
+        simply select nothing.
+        :return: array of shape (junctions, hours, vehicle types, weathers)
+        """
+        if measure in SUMS:
+            data = getattr(self, measure)
+        elif measure in self.measures:
+            data = self.counts[..., self.measures.index(measure)]
+        else:
+            raise KeyError(f"Measure {measure!r} was not registered when this cube was built")
+        for dimension, wanted in (
+            ("junction", junction),
+            ("hour", hour),
+            ("vehicle_type", vehicle_type),
+            ("weather", weather),
+        ):
+            if wanted is not None:
+                data = data.take(self._indices(self.labels(dimension), wanted), axis=AXES[dimension])
+        return data
+
+    def grouped(self, by, measure="vehicles", **filters):
+        """
+        :param by: dimension to group by ("junction", "hour", "vehicle_type" or "weather"),
+            or a tuple of dimensions, e.g. ("junction", "hour") for every junction's hours
+        :return: (labels, counts) with one count per label of that dimension; for a
+            tuple, one list of labels per dimension and an array with one axis per dimension
+        """
+        dimensions = (by,) if isinstance(by, str) else tuple(by)
+        data = self.select(measure, **filters)
+        axes = [AXES[dimension] for dimension in dimensions]
+        counts = data.sum(axis=tuple(axis for axis in range(4) if axis not in axes))
+        # The sum keeps the cube's axis order; put the axes in the order asked for
+        counts = np.moveaxis(counts, [sorted(axes).index(axis) for axis in axes], range(len(axes)))
+
+        labels = []
+        for dimension in dimensions:
+            dimension_labels = self.labels(dimension)
+            if filters.get(dimension) is not None:
+                dimension_labels = [dimension_labels[i] for i in self._indices(dimension_labels, filters[dimension])]
+            labels.append(dimension_labels)
+        return (labels[0] if isinstance(by, str) else labels), counts
+
+    def hourly(self, measure="vehicles", **filters):
+        """
+        :return: array of 24 counts, one per hour
+        """
+        return self.select(measure, **filters).sum(axis=(0, 2, 3))
+
+    def total(self, measure="vehicles", **filters):
+        return int(self.select(measure, **filters).sum())
@@ -0,0 +1,226 @@
+# SQLite store of daily traffic aggregates.
+#
+# Each processed day is written as one row per (date, junction, hour,
+# vehicle type, weather) cell of its TrafficCube, holding every cube
+# measure plus speed statistics. Questions across many days are then
+# answered with indexed SQL instead of reopening CSV files:
+#
+#   python traffic_db.py load --glob "traffic_data*2024.csv"
+#   python traffic_db.py peak --junction "Hanley Highway/Westway" --days 90
+#   python traffic_db.py hourly --junction "Elm Avenue/Rabbit Road" --vehicle-type Scooter --days 30
+
+import argparse
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from traffic_batch import add_source_arguments, file_date, source_paths
+from traffic_cube import MEASURES
+from traffic_parallel import load_cube
+from traffic_profile import PROFILER, add_profile_argument, profiled_map, start_profiling
+
+DEFAULT_DB = "traffic.db"
+KEY_COLUMNS = ["date", "junction", "hour", "vehicle_type", "weather"]
+SPEED_COLUMNS = ["speed_sum", "speed_max"]
+
+
+def connect(db_path=DEFAULT_DB):
+    """
+    Open (and create or upgrade) the database
+    """
+    connection = sqlite3.connect(db_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS daily_aggregates (
+            date TEXT NOT NULL,
+            junction TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            vehicle_type TEXT NOT NULL,
+            weather TEXT NOT NULL,
+            speed_sum INTEGER NOT NULL,
+            speed_max INTEGER NOT NULL,
+            PRIMARY KEY (date, junction, hour, vehicle_type, weather)
+        ) WITHOUT ROWID
+    """)
+    # One INTEGER column per cube measure; measures registered later are added on open
+    existing = {row[1] for row in connection.execute("PRAGMA table_info(daily_aggregates)")}
+    for measure in MEASURES:
+        if measure not in existing:
+            connection.execute(f"ALTER TABLE daily_aggregates ADD COLUMN {measure} INTEGER NOT NULL DEFAULT 0")
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS aggregates_by_junction ON daily_aggregates (junction, date, hour)"
+    )
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS days (
+            date TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            vehicles INTEGER NOT NULL,
+            loaded_at TEXT NOT NULL
+        )
+    """)
+    connection.commit()
+    return connection
+
+
+def iso_date(date):
+    """
+    "15/06/2024" -> "2024-06-15" (ISO dates sort and compare as text)
+    """
+    return datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
+
+
+@PROFILER.timed("save")
+def store_day(connection, date, cube, source=""):
+    """
+    Replace everything stored for `date` ("DD/MM/YYYY") with the cells of cube
+    """
+    day = iso_date(date)
+    measures = cube.measures
+    vehicles = cube.counts[..., measures.index("vehicles")]
+    cells = np.argwhere(vehicles > 0)
+
+    rows = [
+        (day, cube.junctions[j], int(h), cube.vehicle_types[v], cube.weathers[w],
+         int(cube.speed_sum[j, h, v, w]), int(cube.speed_max[j, h, v, w]),
+         *cube.counts[j, h, v, w].tolist())
+        for j, h, v, w in cells
+    ]
+    columns = KEY_COLUMNS + SPEED_COLUMNS + measures
+    with connection:
+        connection.execute("DELETE FROM daily_aggregates WHERE date = ?", (day,))
+        connection.executemany(
+            f"INSERT INTO daily_aggregates ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?)",
+            (day, source, int(vehicles.sum()), datetime.now().isoformat(timespec="seconds")),
+        )
+    return len(rows)
+
+
+def load_files(connection, paths, workers=None):
+    """
+    Build the cube of every file in worker processes and store each day
+    :return: number of days stored
+    """
+    stored = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, cube in zip(paths, profiled_map(pool, load_cube, paths)):
+            if cube is not None:
+                store_day(connection, file_date(path), cube, path)
+                stored += 1
+    return stored
+
+
+def date_window(connection, days, until=None):
+    """
+    (first, last) ISO dates of the `days`-day window ending at `until`
+    ("DD/MM/YYYY"), or at the latest stored day when until is None
+    """
+    if until is None:
+        last = connection.execute("SELECT MAX(date) FROM days").fetchone()[0]
+        if last is None:
+            return None, None
+    else:
+        last = iso_date(until)
+    first = (datetime.strptime(last, "%Y-%m-%d") - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return first, last
+
+
+def hourly_totals(connection, junction, first, last, measure="vehicles", vehicle_type=None, weather=None):
+    """
+    :return: list of 24 totals of `measure` per hour at a junction between two ISO dates
+    """
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure {measure!r}")
+    sql = f"SELECT hour, SUM({measure}) FROM daily_aggregates WHERE junction = ? AND date BETWEEN ? AND ?"
+    parameters = [junction, first, last]
+    if vehicle_type is not None:
+        sql += " AND vehicle_type = ?"
+        parameters.append(vehicle_type)
+    if weather is not None:
+        sql += " AND weather = ?"
+        parameters.append(weather)
+    totals = [0] * 24
+    for hour, total in connection.execute(sql + " GROUP BY hour", parameters):
+        totals[hour] = total
+    return totals
+
+
+def peak_hours(connection, junction, first, last):
+    """
+    :return: (highest vehicles in one hour of one day, list of (ISO date, hour) reaching it)
+    """
+    rows = connection.execute("""
+        SELECT date, hour, SUM(vehicles) AS total FROM daily_aggregates
+        WHERE junction = ? AND date BETWEEN ? AND ?
+        GROUP BY date, hour
+    """, (junction, first, last)).fetchall()
+    peak = max((total for _, _, total in rows), default=0)
+    return peak, [(date, hour) for date, hour, total in rows if total == peak and peak]
+
+
+def average_speed(connection, junction, first, last):
+    """
+    :return: mean VehicleSpeed at a junction between two ISO dates, or None without data
+    """
+    speed_sum, vehicles = connection.execute("""
+        SELECT SUM(speed_sum), SUM(vehicles) FROM daily_aggregates
+        WHERE junction = ? AND date BETWEEN ? AND ?
+    """, (junction, first, last)).fetchone()
+    return speed_sum / vehicles if vehicles else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store processed traffic days in SQLite and query them.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database file")
+    add_profile_argument(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="process traffic files and store their aggregates")
+    add_source_arguments(load)
+    load.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+
+    for name, text in (("peak", "busiest hour(s) at a junction"), ("hourly", "vehicles per hour at a junction")):
+        query = commands.add_parser(name, help=text)
+        query.add_argument("--junction", required=True)
+        query.add_argument("--days", type=int, default=90, help="length of the window in days")
+        query.add_argument("--until", help="last day of the window, DD/MM/YYYY (default: latest stored day)")
+        if name == "hourly":
+            query.add_argument("--vehicle-type")
+            query.add_argument("--weather")
+            query.add_argument("--measure", default="vehicles", choices=list(MEASURES))
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+    connection = connect(args.db)
+
+    if args.command == "load":
+        paths = source_paths(load, args)
+        print(f"Stored {load_files(connection, paths, args.workers)} of {len(paths)} day(s) in {args.db}")
+        return
+
+    first, last = date_window(connection, args.days, args.until)
+    if first is None:
+        print("The database is empty; run the load command first.")
+        return
+    print(f"{args.junction}, {first} to {last}")
+    if args.command == "peak":
+        peak, hours = peak_hours(connection, args.junction, first, last)
+        print(f"Peak hour traffic: {peak}")
+        for date, hour in hours:
+            print(f"  {date} between {hour}:00 and {hour + 1}:00")
+        speed = average_speed(connection, args.junction, first, last)
+        if speed is not None:
+            print(f"Average speed: {speed:.1f}")
+    else:
+        totals = hourly_totals(connection, args.junction, first, last, args.measure, args.vehicle_type, args.weather)
+        for hour, total in enumerate(totals):
+            print(f"  {hour:02}:00 {total}")
+
+
+if __name__ == "__main__":
+    main()
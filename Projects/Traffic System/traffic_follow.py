@@ -0,0 +1,170 @@
+# Live "tail -f" mode for a traffic CSV that sensors keep appending to.
+#
+# Only the bytes appended since the last poll are parsed. They become a small
+# TrafficCube that is merged into the running cube, so each refresh costs time
+# proportional to the new rows, not to the whole file. A partly written last
+# line is left for the next poll.
+#
+#   python traffic_follow.py traffic_data17102026.csv --interval 5 --plot
+
+import argparse
+import os
+import time
+
+from Traffic import HISTOGRAM_JUNCTIONS, compute_outcomes, display_outcomes, hourly_histograms
+from traffic_columns import REQUIRED_COLUMNS, quarantine, read_csv_columns
+from traffic_cube import TrafficCube
+from traffic_profile import PROFILER, add_profile_argument, start_profiling
+
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+def last_line_end(file, start, end):
+    """
+    Offset just after the last newline in file[start:end], or start if there is none
+    """
+    position = end
+    while position > start:
+        block_start = max(start, position - TAIL_BLOCK_BYTES)
+        file.seek(block_start)
+        block = file.read(position - block_start)
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            return block_start + newline + 1
+        position = block_start
+    return start
+
+
+class TrafficFollower:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.reset()
+
+    def reset(self):
+        self.position = None  # offset of the first byte not parsed yet
+        self.inode = None
+        self.cube = None
+        self.rows = 0
+
+    def poll(self):
+        """
+        Parse the complete lines appended since the last call.
+        :return: number of new rows (0 if nothing new or the file is not there yet)
+        """
+        if not os.path.exists(self.file_path):
+            return 0
+        stat = os.stat(self.file_path)
+        size = stat.st_size
+        if self.position is not None and (size < self.position or stat.st_ino != self.inode):
+            # The file was truncated or replaced: start again from the top
+            self.reset()
+        self.inode = stat.st_ino
+
+        first = self.position is None
+        with open(self.file_path, "rb") as file:
+            if first:
+                header = file.readline()
+                if not header.endswith(b"\n"):
+                    return 0
+                headers = header.decode("utf-8").strip().split(",")
+                if not all(col in headers for col in REQUIRED_COLUMNS):
+                    raise ValueError("CSV file does not have the required format.")
+                self.position = file.tell()
+            end = last_line_end(file, self.position, size)
+
+        if end <= self.position:
+            return 0
+        columns = read_csv_columns(self.file_path, self.position, end)
+        self.position = end
+        if columns is None:
+            return 0
+        # A new or replaced file starts a new side file; later polls add to it
+        quarantine(self.file_path, columns.rejected, append=not first)
+        if len(columns) == 0:
+            return 0
+
+        new_cube = TrafficCube.from_columns(columns)
+        self.cube = new_cube if self.cube is None else TrafficCube.merge([self.cube, new_cube])
+        self.rows += len(columns)
+        return len(columns)
+
+    def outcomes(self):
+        return compute_outcomes(self.cube) if self.cube is not None else None
+
+    def histograms(self):
+        return hourly_histograms(self.cube) if self.cube is not None else None
+
+
+class LiveHistogram:
+    """
+    One matplotlib window whose bar heights are updated in place
+    """
+
+    def __init__(self, title):
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        plt.ion()
+        self.fig, self.ax = plt.subplots(figsize=(10, 6))
+        colors = ["red", "green"]
+        aligns = ["center", "edge"]
+        self.bars = {
+            junction: self.ax.bar(range(24), [0] * 24, width=0.4, label=junction, align=align, color=color)
+            for junction, align, color in zip(HISTOGRAM_JUNCTIONS, aligns, colors)
+        }
+        self.ax.set_xlabel('Hours (00:00 to 24:00)')
+        self.ax.set_ylabel('Vehicle Frequency')
+        self.ax.set_title(title)
+        self.ax.legend()
+        self.fig.tight_layout()
+
+    @PROFILER.timed("render")
+    def update(self, histograms):
+        for junction, bars in self.bars.items():
+            for bar, count in zip(bars, histograms[junction]):
+                bar.set_height(count)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.canvas.draw_idle()
+
+    def pause(self, seconds):
+        self.plt.pause(seconds)
+
+
+def follow(file_path, interval=5.0, plot=False):
+    follower = TrafficFollower(file_path)
+    histogram = LiveHistogram(f"Live vehicle frequency per hour ({file_path})") if plot else None
+
+    while True:
+        new_rows = follower.poll()
+        if new_rows:
+            print(f"\n{time.strftime('%H:%M:%S')} +{new_rows} rows ({follower.rows} total)")
+            display_outcomes(follower.outcomes())
+            if histogram:
+                histogram.update(follower.histograms())
+
+        if histogram:
+            histogram.pause(interval)
+        else:
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Follow a growing traffic CSV and keep the outcomes up to date.")
+    parser.add_argument("file", help="traffic_dataDDMMYYYY.csv being written to")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between refreshes")
+    parser.add_argument("--plot", action="store_true", help="show a live hourly histogram")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    try:
+        follow(args.file, args.interval, args.plot)
+    except KeyboardInterrupt:
+        print("\nStopped following.")
+
+
+if __name__ == "__main__":
+    main()
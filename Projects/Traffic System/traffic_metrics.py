@@ -0,0 +1,163 @@
+# Declarative metric specs for the traffic outcomes.
+#
+# A Metric says what to count (a cube measure plus filters on junction, hour,
+# vehicle type and weather) and how to aggregate it. compile_metrics() checks
+# a list of specs once and returns a function that evaluates all of them on a
+# TrafficCube. The cube is filled in a single pass over the data, so adding a
+# metric never adds a scan; a metric that needs a new kind of row (e.g. speed
+# above 60) registers a measure with traffic_cube.register_measure().
+# Besides counting, "sum" adds up one of the values the cube keeps per cell
+# (traffic_cube.SUMS, e.g. speed_sum).
+#
+#   Metric("Total trucks", where={"vehicle_type": "Truck"})
+#   Metric("Percentage of trucks", "ratio", where={"vehicle_type": "Truck"})
+#   Metric("Peak hour(s)", "argmax", group_by="hour", label=lambda hour: f"{hour}:00")
+#   Metric("Vehicles", per="junction")   # {junction: count} for every junction at once
+#   Metric("Total speed of buses", "sum", measure="speed_sum", where={"vehicle_type": "Buss"})
+
+import hashlib
+import json
+from types import CodeType
+
+from traffic_cube import AXES, MEASURES, SUMS
+from traffic_profile import PROFILER
+
+AGGREGATIONS = ["count", "sum", "ratio", "mean", "max", "argmax", "groups"]
+
+
+class Metric:
+
+    def __init__(self, name, agg="count", measure="vehicles", where=None, of=None, group_by=None, label=str,
+                 per=None):
+        """
+        :param name: key of the metric in the outcomes dict
+        :param agg: how to aggregate the counts:
+            count  - number of rows matching measure and where
+            sum    - total of a per-cell value (measure one of traffic_cube.SUMS) over the cells matching where
+            ratio  - that number as a rounded percentage of the vehicles matching `of`
+            mean   - rounded average count over the non-empty groups of group_by
+            max    - count of the largest group
+            argmax - label(group) of every group sharing the largest (non-zero) count
+            groups - number of non-empty groups
+        :param measure: cube measure to count (see traffic_cube.MEASURES), or for sum one of traffic_cube.SUMS
+        :param where: dict of filters, e.g. {"junction": "Elm Avenue/Rabbit Road"}
+        :param of: filters of the ratio's denominator (default: all vehicles)
+        :param group_by: "junction", "hour", "vehicle_type" or "weather"
+        :param label: turns a group label into the text reported by argmax
+        :param per: dimension (e.g. "junction") to evaluate the metric for each label of;
+            the result is then a dict label -> value, computed from one group-by of the cube
+        """
+        self.name = name
+        self.agg = agg
+        self.measure = measure
+        self.where = where or {}
+        self.of = of or {}
+        self.group_by = group_by
+        self.label = label
+        self.per = per
+
+    def check(self):
+        if self.agg not in AGGREGATIONS:
+            raise ValueError(f"{self.name}: unknown aggregation {self.agg!r}")
+        if self.agg == "sum" and self.measure not in SUMS:
+            raise ValueError(f"{self.name}: sum needs measure to be one of {SUMS}")
+        if self.agg != "sum" and self.measure not in MEASURES:
+            raise ValueError(f"{self.name}: unknown measure {self.measure!r}")
+        for dimension in list(self.where) + list(self.of):
+            if dimension not in AXES:
+                raise ValueError(f"{self.name}: unknown filter {dimension!r}")
+        needs_group = self.agg in ("mean", "max", "argmax", "groups")
+        if needs_group and self.group_by not in AXES:
+            raise ValueError(f"{self.name}: {self.agg} needs group_by to be one of {list(AXES)}")
+        if self.per is not None and (self.per not in AXES or self.per == self.group_by):
+            raise ValueError(f"{self.name}: per must be one of {list(AXES)} other than group_by")
+
+    def evaluate(self, cube):
+        if self.per is not None:
+            return self.evaluate_per(cube)
+        if self.agg in ("count", "sum"):
+            return cube.total(self.measure, **self.where)
+        if self.agg == "ratio":
+            part = cube.total(self.measure, **self.where)
+            whole = cube.total(**self.of)
+            return round((part / whole) * 100) if whole else 0
+
+        labels, counts = cube.grouped(self.group_by, self.measure, **self.where)
+        return self.reduce(labels, [int(count) for count in counts])
+
+    def evaluate_per(self, cube):
+        """
+        The metric for every label of self.per, as a dict label -> value
+        """
+        if self.agg in ("count", "sum", "ratio"):
+            labels, parts = cube.grouped(self.per, self.measure, **self.where)
+            parts = dict(zip(labels, parts.tolist()))
+            if self.agg != "ratio":
+                return parts
+            labels, wholes = cube.grouped(self.per, **self.of)
+            return {
+                label: round((parts.get(label, 0) / whole) * 100) if whole else 0
+                for label, whole in zip(labels, wholes.tolist())
+            }
+
+        (labels, groups), counts = cube.grouped((self.per, self.group_by), self.measure, **self.where)
+        return {label: self.reduce(groups, row) for label, row in zip(labels, counts.tolist())}
+
+    def reduce(self, labels, counts):
+        """
+        Apply a grouped aggregation (mean, groups, max, argmax) to one count per group label
+        """
+        non_empty = [count for count in counts if count]
+        if self.agg == "mean":
+            return round(sum(non_empty) / len(non_empty)) if non_empty else 0
+        if self.agg == "groups":
+            return len(non_empty)
+        largest = max(counts, default=0)
+        if self.agg == "max":
+            return largest
+        return [self.label(group) for group, count in zip(labels, counts) if count and count == largest]
+
+
+def code_key(function):
+    """
+    Text that changes whenever the code of a function (e.g. a label or measure lambda) changes
+    """
+    code = getattr(function, "__code__", function)
+    if not isinstance(code, CodeType):
+        return getattr(function, "__qualname__", repr(function))
+    # Nested code (comprehensions, inner lambdas) by content, not by its address
+    consts = [code_key(const) if isinstance(const, CodeType) else repr(const) for const in code.co_consts]
+    return code.co_code.hex() + repr(consts)
+
+
+def metrics_fingerprint(*metric_lists):
+    """
+    Short hash of metric specs and of the cube measures they count. It changes whenever a
+    metric is added, removed or changed, so it can version results computed from the specs.
+    """
+    specs = [
+        [metric.name, metric.agg, metric.measure, metric.where, metric.of, metric.group_by, metric.per,
+         code_key(metric.label)]
+        for metrics in metric_lists for metric in metrics
+    ]
+    measures = {name: code_key(mask) if mask is not None else None for name, mask in MEASURES.items()}
+    text = json.dumps([specs, measures], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def compile_metrics(metrics):
+    """
+    Check every spec once and return a function cube -> outcomes dict
+    (in the order of the specs)
+    """
+    names = [metric.name for metric in metrics]
+    if len(set(names)) != len(names):
+        raise ValueError("Metric names must be unique")
+    for metric in metrics:
+        metric.check()
+
+    @PROFILER.timed("outcomes")
+    def evaluate(cube):
+        return {metric.name: metric.evaluate(cube) for metric in metrics}
+
+    return evaluate
@@ -0,0 +1,99 @@
+# Map-reduce processing of one large traffic CSV over several cores.
+#
+# The data part of the file is cut into byte ranges that start and end on
+# line boundaries. Each range is parsed by its own worker process into a
+# TrafficCube, which is a plain table of counts and therefore mergeable:
+# the partial cubes are added up and the outcomes are computed from the sum.
+# Peak hours and rainy hours are read from the merged hourly counts, so ties
+# across chunk borders and the union of rainy hours come out exactly as for
+# a single pass over the file.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from traffic_columns import binary_path_for, load_columns, open_binary, outdated_binary, quarantine, read_csv_columns
+from traffic_cube import TrafficCube
+from traffic_profile import profiled_map
+
+# Files smaller than this are parsed in the calling process
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+
+def split_ranges(file_path, parts):
+    """
+    Cut the rows of a CSV (everything after the header) into at most `parts`
+    byte ranges, each starting at the beginning of a line.
+    :return: list of (start, end) byte offsets
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        file.readline()
+        data_start = file.tell()
+
+        boundaries = [data_start]
+        step = max(1, (size - data_start) // parts)
+        for i in range(1, parts):
+            target = data_start + i * step
+            if target <= boundaries[-1]:
+                continue
+            # Move the cut forward to just after the next newline
+            file.seek(target - 1)
+            file.readline()
+            position = file.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+        boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def aggregate_range(file_path, start, end):
+    """
+    Worker: parse one byte range into a partial cube
+    :return: (cube, rejected rows of the range), or (None, []) if the file is malformed
+    """
+    columns = read_csv_columns(file_path, start, end)
+    if columns is None:
+        return None, []
+    return TrafficCube.from_columns(columns), columns.rejected
+
+
+def parallel_cube(file_path, workers=None):
+    """
+    Build the cube of a file by parsing byte ranges in worker processes.
+    :return: TrafficCube, or None if the file is missing or malformed
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = split_ranges(file_path, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = profiled_map(
+            pool,
+            aggregate_range,
+            [file_path] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges],
+        )
+    if any(cube is None for cube, _ in partials):
+        return None
+    quarantine(file_path, [row for _, rejected in partials for row in rejected])
+    return TrafficCube.merge([cube for cube, _ in partials])
+
+
+def load_cube(file_path, workers=1):
+    """
+    The cube of a traffic file. An up to date .tcol file is always used first;
+    otherwise a large CSV is parsed by `workers` processes (None = one per core).
+    :return: TrafficCube, or None if the file is missing or malformed
+    """
+    if workers != 1 and os.path.exists(file_path) and os.path.getsize(file_path) >= PARALLEL_MIN_BYTES:
+        binary_path = binary_path_for(file_path)
+        columns = open_binary(binary_path, file_path) if os.path.exists(binary_path) else None
+        if columns is None and outdated_binary(binary_path):
+            # Parse it once in this process to write the .tcol file in the current format
+            columns = load_columns(file_path)
+        elif columns is None:
+            return parallel_cube(file_path, workers)
+    else:
+        columns = load_columns(file_path)
+
+    return TrafficCube.from_columns(columns) if columns is not None else None
@@ -0,0 +1,189 @@
+# Per-stage timers and counters for the traffic pipeline.
+#
+# The pipeline code marks its stages with PROFILER.stage("parse") or the
+# @PROFILER.timed("aggregate") decorator, and its work with
+# PROFILER.count("rows", n). They do nothing until profiling is switched
+# on, and when it is on they cost one perf_counter() pair per batch or per
+# file, so it can stay enabled on production runs.
+#
+# Switch it on with --profile REPORT.json on the command line tools, or with
+# the TRAFFIC_PROFILE=REPORT.json environment variable (e.g. for Traffic.py).
+# The JSON report is written when the program exits:
+#
+#   {"command": [...], "wall_seconds": 4.2,
+#    "stages": {"read": {"seconds": 0.3, "calls": 12}, "parse": {...}, ...},
+#    "counters": {"rows": 400500, "rejected_rows": 0, ...},
+#    "peak_rss_mb": {"self": 61.0, "children": 0.0}}
+#
+# Peak memory comes from the resource module, which only exists on Unix; on
+# Windows it is reported as null.
+#
+# Stages:   read, parse, validate, encode (dictionary codes), aggregate,
+#           merge, outcomes, histograms, hash, render, save
+# Work done inside pool workers is sent back with each result and added
+# in, see profiled_map().
+
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENVIRONMENT_VARIABLE = "TRAFFIC_PROFILE"
+
+
+def peak_rss_mb(children=False):
+    """
+    :param children: of the finished child processes instead of this one
+    :return: peak resident memory in MB, or None where it cannot be measured
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _Timer:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds, calls = self.profiler.stages.get(self.name, (0.0, 0))
+        self.profiler.stages[self.name] = (seconds + time.perf_counter() - self.start, calls + 1)
+
+
+class Profiler:
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.stages = {}    # name -> (seconds, calls)
+        self.counters = {}  # name -> total
+
+    def stage(self, name):
+        """
+        Context manager timing one stage (nested stages are timed separately)
+        """
+        return _Timer(self, name) if self.enabled else nullcontext()
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as stage `name`
+        """
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """
+        Everything recorded so far, in a form that can cross process boundaries
+        """
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+
+    def absorb(self, snapshot):
+        """
+        Add the stages and counters recorded by another process
+        """
+        for name, (seconds, calls) in snapshot["stages"].items():
+            total, total_calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, total_calls + calls)
+        for name, amount in snapshot["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        return {
+            "command": sys.argv,
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": time.perf_counter() - self.started,
+            "stages": {
+                name: {"seconds": seconds, "calls": calls}
+                for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            },
+            "counters": self.counters,
+            "peak_rss_mb": {
+                "self": peak_rss_mb(),
+                "children": peak_rss_mb(children=True),
+            },
+        }
+
+    def write_report(self, report_path):
+        with open(report_path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+PROFILER = Profiler()
+
+
+def start_profiling(report_path):
+    """
+    Switch profiling on for this run and write the report to report_path at exit
+    """
+    PROFILER.enabled = True
+    PROFILER.reset()
+    atexit.register(PROFILER.write_report, report_path)
+
+
+def add_profile_argument(parser):
+    parser.add_argument("--profile", metavar="REPORT.json", help="write a per-stage timing report")
+
+
+class _Profiled:
+    """
+    Pool worker wrapper: runs the function and returns (result, what it recorded)
+    """
+
+    def __init__(self, function, enabled):
+        self.function = function
+        self.enabled = enabled
+
+    def __call__(self, *args):
+        if not self.enabled:
+            return self.function(*args), None
+        PROFILER.enabled = True
+        PROFILER.reset()
+        result = self.function(*args)
+        return result, PROFILER.snapshot()
+
+
+def profiled_map(pool, function, *iterables, **kwargs):
+    """
+    pool.map() that also collects the stage timings of the workers
+    :return: list of results
+    """
+    results = []
+    for result, snapshot in pool.map(_Profiled(function, PROFILER.enabled), *iterables, **kwargs):
+        if snapshot is not None:
+            PROFILER.absorb(snapshot)
+        results.append(result)
+    return results
+
+
+# Only the main process writes the report; workers send theirs back
+if os.environ.get(ENVIRONMENT_VARIABLE) and multiprocessing.parent_process() is None:
+    start_profiling(os.environ[ENVIRONMENT_VARIABLE])
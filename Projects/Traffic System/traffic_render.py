@@ -0,0 +1,226 @@
+# Headless batch rendering of the hourly histograms for many days.
+#
+# Instead of a Tk window and plt.show() per day, each worker process draws
+# on one Agg figure that it keeps for all its days: the bars are created
+# once and only their heights, the y range and the title change between
+# days. The hourly counts come from the result cache, so days that were
+# processed before are not parsed again.
+#
+# Files with more junctions than the two of the coursework data are drawn as
+# small multiples: one small histogram per junction, all on the same scale.
+#
+#   python traffic_render.py --start 01/01/2024 --end 31/12/2024 --format png svg
+#   python traffic_render.py --glob "traffic_data*2024.csv" --layout grid
+
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+
+from Traffic import HISTOGRAM_JUNCTIONS
+from traffic_batch import add_source_arguments, file_date, source_paths
+from traffic_cache import DEFAULT_CACHE_DIR, ResultCache
+from traffic_profile import PROFILER, add_profile_argument, profiled_map, start_profiling
+
+# Small multiples: each junction's cell is 1 wide; its bars use BAR_SPACE
+# of the CELL_HEIGHT and the name sits above them
+CELL_WIDTH = 1.1
+CELL_HEIGHT = 1.0
+BAR_SPACE = 0.75
+
+BAR_STYLES = [
+    {"align": "center", "color": "red"},
+    {"align": "edge", "color": "green"},
+]
+
+
+class HistogramRenderer:
+    """
+    One reusable figure with the same layout as HistogramApp in test.py
+    """
+
+    def __init__(self):
+        # Figure + FigureCanvasAgg directly, so pyplot and any GUI backend are never involved
+        self.figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.bars = {
+            junction: self.ax.bar(range(24), [0] * 24, width=0.4, label=junction, **style)
+            for junction, style in zip(HISTOGRAM_JUNCTIONS, BAR_STYLES)
+        }
+        self.ax.set_xlabel('Hours (00:00 to 24:00)')
+        self.ax.set_ylabel('Vehicle Frequency')
+        # Placeholder title of the final length, so tight_layout leaves room for it
+        self.title = self.ax.set_title("Histogram of Vehicle Frequency per Hour (DD/MM/YYYY)")
+        self.ax.legend()
+        self.figure.tight_layout()
+
+    @PROFILER.timed("render")
+    def render(self, histograms, date, paths):
+        """
+        Draw one day and save it to every path (format taken from the extension)
+        """
+        highest = 0
+        for junction, bars in self.bars.items():
+            for bar, count in zip(bars, histograms[junction]):
+                bar.set_height(count)
+            highest = max(highest, max(histograms[junction], default=0))
+        self.ax.set_ylim(0, max(1, highest) * 1.05)
+        self.title.set_text(f"Histogram of Vehicle Frequency per Hour ({date})")
+        for path in paths:
+            self.figure.savefig(path)
+
+
+class SmallMultiplesRenderer:
+    """
+    A grid with one small hourly histogram per junction, all on one scale.
+
+    With hundreds of junctions, one Axes per junction makes matplotlib spend
+    minutes on layout. Instead the whole grid lives in a single Axes: the bars
+    of every junction are one PolyCollection whose rectangles are resized
+    for each day, and the junction names are plain text.
+    """
+
+    def __init__(self, junctions, figure=None):
+        """
+        :param figure: figure to draw on (e.g. a pyplot one); by default an Agg figure
+        """
+        self.junctions = list(junctions)
+        self.columns = math.ceil(math.sqrt(len(self.junctions)))
+        self.rows = math.ceil(len(self.junctions) / self.columns)
+        if figure is None:
+            figure = Figure()
+            FigureCanvasAgg(figure)
+        self.figure = figure
+        self.figure.set_size_inches(max(10, 1.6 * self.columns), max(6, 1.3 * self.rows + 1))
+        self.ax = self.figure.add_axes([0.01, 0.05, 0.98, 0.88])
+        self.ax.set_axis_off()
+        self.ax.set_xlim(0, self.columns * CELL_WIDTH)
+        self.ax.set_ylim(0, self.rows * CELL_HEIGHT)
+
+        # Lower left corner of every junction's cell, and of every bar in it
+        position = np.arange(len(self.junctions))
+        self.cell_x = (position % self.columns) * CELL_WIDTH
+        self.cell_y = (self.rows - 1 - position // self.columns) * CELL_HEIGHT
+        self.bar_x = self.cell_x[:, None] + (np.arange(24) + 0.1) / 24
+        self.bars = PolyCollection(self.bar_verts(np.zeros((len(self.junctions), 24))), color="steelblue")
+        self.ax.add_collection(self.bars)
+        frames = [[(x, y), (x + 1, y), (x + 1, y + BAR_SPACE), (x, y + BAR_SPACE)]
+                  for x, y in zip(self.cell_x, self.cell_y)]
+        self.ax.add_collection(PolyCollection(frames, facecolor="none", edgecolor="lightgray", linewidth=0.5))
+        for junction, x, y in zip(self.junctions, self.cell_x, self.cell_y):
+            self.ax.text(x + 0.5, y + BAR_SPACE + 0.03, junction, fontsize=7, ha="center", va="bottom", clip_on=True)
+        self.title = self.figure.suptitle("Vehicle Frequency per Hour and Junction (DD/MM/YYYY)")
+        self.figure.text(0.5, 0.005, "Each cell: hours 00:00 to 24:00, bar heights on one scale for all junctions",
+                         ha="center", va="bottom", fontsize=8)
+
+    def bar_verts(self, heights):
+        """
+        Rectangles of all bars: heights is an array (junctions, 24) of fractions of the cell height
+        """
+        left = self.bar_x
+        right = left + 0.8 / 24
+        bottom = np.broadcast_to(self.cell_y[:, None], heights.shape)
+        top = bottom + heights * BAR_SPACE
+        corners = np.stack([
+            np.stack([left, bottom], axis=-1), np.stack([right, bottom], axis=-1),
+            np.stack([right, top], axis=-1), np.stack([left, top], axis=-1),
+        ], axis=2)
+        return corners.reshape(-1, 4, 2)
+
+    def draw(self, histograms, date):
+        counts = np.array([histograms.get(junction, [0] * 24) for junction in self.junctions], dtype=float)
+        highest = max(1, int(counts.max(initial=0)))
+        self.bars.set_verts(self.bar_verts(counts / highest))
+        self.title.set_text(f"Vehicle Frequency per Hour and Junction ({date}), tallest bar = {highest} vehicles")
+
+    @PROFILER.timed("render")
+    def render(self, histograms, date, paths):
+        self.draw(histograms, date)
+        for path in paths:
+            self.figure.savefig(path)
+
+
+def use_grid(histograms, layout):
+    """
+    :param layout: "overlay", "grid", or "auto" (grid when there are more junctions than the usual two)
+    """
+    if layout == "auto":
+        return any(junction not in HISTOGRAM_JUNCTIONS for junction in histograms)
+    return layout == "grid"
+
+
+# Renderers of each worker process, created by the pool initializer. Grid
+# renderers are kept per junction list, since days usually share theirs.
+_renderer = None
+_grid_renderers = {}
+
+
+def _start_worker():
+    global _renderer
+    _renderer = HistogramRenderer()
+
+
+def render_file(file_path, output_dir, formats, cache_dir=DEFAULT_CACHE_DIR, layout="auto"):
+    """
+    Worker: render the histogram of one traffic file.
+    :return: list of written image paths (empty if the file could not be processed)
+    """
+    _, histograms = ResultCache(cache_dir).process(file_path)
+    if histograms is None:
+        return []
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    paths = [os.path.join(output_dir, f"{name}.{extension}") for extension in formats]
+    if use_grid(histograms, layout):
+        junctions = tuple(histograms)
+        if junctions not in _grid_renderers:
+            _grid_renderers[junctions] = SmallMultiplesRenderer(junctions)
+        _grid_renderers[junctions].render(histograms, file_date(file_path), paths)
+    else:
+        _renderer.render(histograms, file_date(file_path), paths)
+    return paths
+
+
+def render_files(paths, output_dir, formats=("png",), workers=None, cache_dir=DEFAULT_CACHE_DIR, layout="auto"):
+    """
+    Render every file's histogram in a pool of worker processes.
+    :return: list of written image paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    worker = partial(render_file, output_dir=output_dir, formats=formats, cache_dir=cache_dir, layout=layout)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker) as pool:
+        chunksize = max(1, len(paths) // (4 * (workers or os.cpu_count() or 1)))
+        return [image for images in profiled_map(pool, worker, paths, chunksize=chunksize) for image in images]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render hourly histograms of many traffic days to image files.")
+    add_source_arguments(parser)
+    parser.add_argument("--output-dir", default="histograms", help="folder for the images")
+    parser.add_argument("--format", nargs="+", default=["png"], choices=["png", "svg", "pdf"], help="image formats")
+    parser.add_argument("--layout", default="auto", choices=["auto", "overlay", "grid"],
+                        help="two overlaid junctions, or one small histogram per junction (auto: grid when needed)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="result cache folder")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    paths = source_paths(parser, args)
+    if not paths:
+        print("No traffic data files found.")
+        return
+
+    images = render_files(paths, args.output_dir, args.format, args.workers, args.cache_dir, args.layout)
+    print(f"Wrote {len(images)} image(s) for {len(paths)} file(s) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Mergeable speed distributions per junction and hour.
+#
+# VehicleSpeed is a small whole number, so a histogram with one bin per
+# speed (0 .. SPEED_BINS - 1, anything faster in the last bin) is already a
+# complete description of the distribution. It is filled with np.bincount
+# together with the cube, merges by adding counts, and its size depends
+# only on the number of junctions, never on the number of rows. Quantiles
+# such as p50/p85/p99 come out exact, for one day or for months of days.
+#
+#   python traffic_sketch.py --start 01/01/2024 --end 31/03/2024
+#   python traffic_sketch.py --glob "traffic_data*2024.csv" --by-hour --percentiles 85
+
+import argparse
+import math
+
+import numpy as np
+
+HOURS = 24
+SPEED_BINS = 256
+DEFAULT_PERCENTILES = [50, 85, 99]
+
+
+class SpeedSketch:
+
+    def __init__(self, junctions, counts):
+        self.junctions = junctions  # labels of axis 0
+        self.counts = counts        # int64, shape (junctions, 24, SPEED_BINS): vehicles per speed
+
+    @classmethod
+    def from_columns(cls, columns):
+        junctions = columns.values["JunctionName"]
+        cell = columns.codes["JunctionName"].astype(np.intp) * HOURS + columns.hour
+        speed = np.clip(columns.speed, 0, SPEED_BINS - 1)
+        size = len(junctions) * HOURS * SPEED_BINS
+        counts = np.bincount(cell * SPEED_BINS + speed, minlength=size)
+        return cls(list(junctions), counts.astype(np.int64).reshape(len(junctions), HOURS, SPEED_BINS))
+
+    @classmethod
+    def merge(cls, sketches):
+        """
+        Combine the sketches of different chunks or days
+        """
+        junctions = []
+        for sketch in sketches:
+            junctions += [label for label in sketch.junctions if label not in junctions]
+        counts = np.zeros((len(junctions), HOURS, SPEED_BINS), dtype=np.int64)
+        for sketch in sketches:
+            counts[[junctions.index(label) for label in sketch.junctions]] += sketch.counts
+        return cls(junctions, counts)
+
+    def distribution(self, junction=None, hour=None):
+        """
+        :param junction: None (all junctions), one label or a list of labels
+        :param hour: None (all hours), one hour or a list of hours
+        :return: array of SPEED_BINS counts
+        """
+        data = self.counts
+        if junction is not None:
+            wanted = [junction] if isinstance(junction, str) else junction
+            data = data[[self.junctions.index(label) for label in wanted if label in self.junctions]]
+        if hour is not None:
+            data = data[:, [hour] if isinstance(hour, int) else list(hour)]
+        return data.sum(axis=(0, 1))
+
+    def quantiles(self, percentiles=DEFAULT_PERCENTILES, junction=None, hour=None):
+        """
+        Nearest-rank percentiles of VehicleSpeed
+        :return: dict percentile -> speed (None when no vehicle matches)
+        """
+        cumulative = np.cumsum(self.distribution(junction, hour))
+        total = int(cumulative[-1])
+        result = {}
+        for percentile in percentiles:
+            if total == 0:
+                result[percentile] = None
+            else:
+                rank = max(1, math.ceil(percentile / 100 * total))
+                result[percentile] = int(np.searchsorted(cumulative, rank))
+        return result
+
+    def to_json(self):
+        """
+        Compact form for JSON files: for every junction and hour with traffic,
+        [junction index, hour, lowest speed, counts from the lowest to the highest speed]
+        """
+        cells = []
+        for j, h in np.argwhere(self.counts.any(axis=2)):
+            speeds = np.flatnonzero(self.counts[j, h])
+            low, high = int(speeds[0]), int(speeds[-1])
+            cells.append([int(j), int(h), low, self.counts[j, h, low:high + 1].tolist()])
+        return {"junctions": self.junctions, "cells": cells}
+
+    @classmethod
+    def from_json(cls, data):
+        counts = np.zeros((len(data["junctions"]), HOURS, SPEED_BINS), dtype=np.int64)
+        for j, h, low, run in data["cells"]:
+            counts[j, h, low:low + len(run)] = run
+        return cls(list(data["junctions"]), counts)
+
+
+def main(argv=None):
+    from traffic_batch import add_source_arguments, source_paths
+    from traffic_cache import DEFAULT_CACHE_DIR, ResultCache
+    from traffic_profile import add_profile_argument, start_profiling
+
+    parser = argparse.ArgumentParser(description="Speed percentiles per junction over many traffic days.")
+    add_source_arguments(parser)
+    parser.add_argument("--percentiles", type=float, nargs="+", default=DEFAULT_PERCENTILES)
+    parser.add_argument("--by-hour", action="store_true", help="also print the percentiles of every hour")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="result cache folder")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    cache = ResultCache(args.cache_dir)
+    sketches = [sketch for sketch in map(cache.speed_sketch, source_paths(parser, args)) if sketch is not None]
+    if not sketches:
+        print("No traffic data files found.")
+        return
+    sketch = SpeedSketch.merge(sketches)
+
+    def line(title, quantiles):
+        values = "  ".join(f"p{percentile:g} {speed if speed is not None else '-'}" for percentile, speed in quantiles.items())
+        print(f"{title:<28}{values}")
+
+    print(f"Speed percentiles over {len(sketches)} day(s)")
+    for junction in sketch.junctions:
+        line(junction, sketch.quantiles(args.percentiles, junction))
+        if args.by_hour:
+            for hour in range(HOURS):
+                line(f"  {hour:02}:00", sketch.quantiles(args.percentiles, junction, hour))
+    line("All junctions", sketch.quantiles(args.percentiles))
+
+
+if __name__ == "__main__":
+    main()
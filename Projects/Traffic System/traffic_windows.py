@@ -0,0 +1,147 @@
+# Traffic flow in short time windows, per junction and approach direction.
+#
+# Every row is binned by its seconds since midnight into BIN_MINUTES-minute
+# bins (288 per day), per junction and travel_Direction_in, with one
+# np.bincount while the cube is built. Any window that is a multiple of the
+# bin (5, 15, 60 minutes, ...) is then a sum of consecutive bins: a sliding
+# window moved one bin at a time is a difference of two cumulative sums, so
+# finer windows never need another pass over the rows.
+#
+#   python traffic_windows.py traffic_data15062024.csv --window 5 15 60
+#   python traffic_windows.py traffic_data15062024.csv --window 15 --junction "Hanley Highway/Westway" --by-direction
+
+import argparse
+
+import numpy as np
+
+BIN_MINUTES = 5
+BINS = 24 * 60 // BIN_MINUTES
+DEFAULT_WINDOWS = [5, 15, 60]
+
+
+def clock(minutes):
+    """
+    Minutes since midnight -> "HH:MM"
+    """
+    return f"{minutes // 60:02}:{minutes % 60:02}"
+
+
+class TrafficFlow:
+
+    def __init__(self, junctions, directions, counts):
+        self.junctions = junctions    # labels of axis 0
+        self.directions = directions  # labels of axis 1 (travel_Direction_in)
+        self.counts = counts          # int64, shape (junctions, directions, BINS): vehicles per bin
+
+    @classmethod
+    def from_columns(cls, columns):
+        junctions = columns.values["JunctionName"]
+        directions = columns.values["travel_Direction_in"]
+        cell = columns.codes["JunctionName"].astype(np.intp) * len(directions) + columns.codes["travel_Direction_in"]
+        cell = cell * BINS + columns.seconds // (BIN_MINUTES * 60)
+        shape = (len(junctions), len(directions), BINS)
+        counts = np.bincount(cell, minlength=int(np.prod(shape))).astype(np.int64).reshape(shape)
+        return cls(list(junctions), list(directions), counts)
+
+    @classmethod
+    def merge(cls, flows):
+        """
+        Add up the flows of different parts of the data (label orders may differ)
+        """
+        junctions, directions = [], []
+        for flow in flows:
+            junctions += [label for label in flow.junctions if label not in junctions]
+            directions += [label for label in flow.directions if label not in directions]
+        counts = np.zeros((len(junctions), len(directions), BINS), dtype=np.int64)
+        for flow in flows:
+            cells = np.ix_(
+                [junctions.index(label) for label in flow.junctions],
+                [directions.index(label) for label in flow.directions],
+                range(BINS),
+            )
+            counts[cells] += flow.counts
+        return cls(junctions, directions, counts)
+
+    def bins(self, junction=None, direction=None):
+        """
+        :param junction, direction: None (all), one label or a list of labels
+        :return: array of BINS vehicle counts
+        """
+        data = self.counts
+        for axis, labels, wanted in ((0, self.junctions, junction), (1, self.directions, direction)):
+            if wanted is not None:
+                wanted = [wanted] if isinstance(wanted, str) else wanted
+                data = data.take([labels.index(label) for label in wanted if label in labels], axis=axis)
+        return data.sum(axis=(0, 1))
+
+    def windows(self, minutes, junction=None, direction=None):
+        """
+        Vehicles in every `minutes`-long window, sliding by BIN_MINUTES
+        :return: array with one count per window start (0:00, 0:05, ...)
+        """
+        if minutes <= 0 or minutes % BIN_MINUTES or minutes > 24 * 60:
+            raise ValueError(f"Window must be a multiple of {BIN_MINUTES} minutes, up to one day")
+        size = minutes // BIN_MINUTES
+        cumulative = np.concatenate([[0], np.cumsum(self.bins(junction, direction))])
+        return cumulative[size:] - cumulative[:-size]
+
+    def rates(self, minutes, junction=None, direction=None):
+        """
+        Flow rate in vehicles per hour of every sliding window
+        """
+        return self.windows(minutes, junction, direction) * (60 / minutes)
+
+    def peak(self, minutes, junction=None, direction=None):
+        """
+        :return: (highest vehicles in one window, list of "HH:MM-HH:MM" windows reaching it)
+        """
+        counts = self.windows(minutes, junction, direction)
+        highest = int(counts.max(initial=0))
+        if highest == 0:
+            return 0, []
+        starts = np.flatnonzero(counts == highest) * BIN_MINUTES
+        return highest, [f"{clock(int(start))}-{clock(int(start) + minutes)}" for start in starts]
+
+
+def main(argv=None):
+    from traffic_parallel import load_cube
+    from traffic_profile import add_profile_argument, start_profiling
+
+    parser = argparse.ArgumentParser(description="Peak traffic windows per junction and direction.")
+    parser.add_argument("file", help="traffic_dataDDMMYYYY.csv")
+    parser.add_argument("--window", type=int, nargs="+", default=DEFAULT_WINDOWS,
+                        help=f"window lengths in minutes (multiples of {BIN_MINUTES})")
+    parser.add_argument("--junction", help="only this junction (default: every junction)")
+    parser.add_argument("--by-direction", action="store_true", help="also report every approach direction")
+    parser.add_argument("--workers", type=int, default=1, help="processes for a large CSV (0 = one per core)")
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    if args.profile:
+        start_profiling(args.profile)
+
+    for minutes in args.window:
+        if minutes <= 0 or minutes % BIN_MINUTES:
+            parser.error(f"--window values must be multiples of {BIN_MINUTES}")
+
+    cube = load_cube(args.file, args.workers or None)
+    if cube is None:
+        return 1
+    flow = cube.flow
+    junctions = [args.junction] if args.junction else flow.junctions
+
+    for junction in junctions:
+        print(f"\n{junction}")
+        groups = [(None, "all directions")]
+        if args.by_direction:
+            groups += [(direction, f"from {direction}") for direction in sorted(flow.directions)]
+        for direction, title in groups:
+            for minutes in args.window:
+                vehicles, windows = flow.peak(minutes, junction, direction)
+                if vehicles:
+                    rate = vehicles * 60 / minutes
+                    print(f"  {title:<16} peak {minutes:>3} min: {vehicles} vehicles ({rate:.0f}/h) at {', '.join(windows)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())